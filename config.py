@@ -1,14 +1,107 @@
 import os
 from dotenv import load_dotenv
-import whisper
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN") # Configuration for Telegram Bot from ".env"
 
-#Whisper Model
-WHISPER_MODEL = "small"  
-model = whisper.load_model(WHISPER_MODEL)
+#Whisper Model (loaded through services/model_registry.py)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+
+# Speech recognition engine: "whisper" (openai-whisper, PyTorch) or "faster-whisper" (CTranslate2, quantized)
+STT_BACKEND = os.getenv("STT_BACKEND", "whisper")
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")  # faster-whisper only: "int8", "int8_float16", "float16", "float32"
+STT_BEAM_SIZE = int(os.getenv("STT_BEAM_SIZE", "1"))  # both engines: 1 decodes greedily, more runs a beam search
+
+# Warm up Whisper and BLIP in the background at startup; when false they are loaded on first use
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "true").lower() == "true"
+
+# Where Whisper and BLIP run: "threads" (the STT_EXECUTOR pool and the caption threads) or
+# "workers" (dedicated worker processes, audio and images handed over through shared memory)
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "threads")
+
+# STT executor: transcription runs in a worker pool so the polling loop keeps dispatching updates.
+# "process": restartable worker processes (as with INFERENCE_MODE=workers), each with its own model.
+# "thread": the workers share one model, and openai-whisper (not thread safe) then decodes one batch
+# at a time, only faster-whisper decodes in parallel
+STT_EXECUTOR = os.getenv("STT_EXECUTOR", "process")  # "process" or "thread"
+STT_WORKERS = int(os.getenv("STT_WORKERS", "2"))
+STT_QUEUE_SIZE = int(os.getenv("STT_QUEUE_SIZE", "16"))  # max transcriptions waiting for a worker
+
+# Micro-batching: voice notes arriving within the window are decoded together
+STT_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+STT_BATCH_WINDOW_MS = int(os.getenv("STT_BATCH_WINDOW_MS", "50"))
+
+# BLIP captioning: photos arriving within the window are captioned in one generate call, off the event loop
+CAPTION_WORKERS = int(os.getenv("CAPTION_WORKERS", "1"))
+CAPTION_QUEUE_SIZE = int(os.getenv("CAPTION_QUEUE_SIZE", "32"))  # max photos waiting for a worker
+CAPTION_BATCH_SIZE = int(os.getenv("CAPTION_BATCH_SIZE", "8"))
+CAPTION_BATCH_WINDOW_MS = int(os.getenv("CAPTION_BATCH_WINDOW_MS", "50"))
+
+# Caption cache keyed by Telegram file_unique_id
+CAPTION_CACHE_SIZE = int(os.getenv("CAPTION_CACHE_SIZE", "1000"))
+CAPTION_CACHE_TTL = int(os.getenv("CAPTION_CACHE_TTL", "86400"))  # seconds
+
+# Transcript cache keyed by Telegram file_unique_id
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "1000"))
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", "21600"))  # seconds
+TRANSCRIPT_CACHE_PERSIST = os.getenv("TRANSCRIPT_CACHE_PERSIST", "false").lower() == "true"  # also keep transcripts in Postgres
+
+# TTS cache: recent audio in memory, older audio spilled to disk
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+
+# Speech engine: "gtts" (Google, online) or "espeak" (espeak-ng, fully offline)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+ESPEAK_PATH = os.getenv("ESPEAK_PATH", "espeak-ng")
+
+# Max number of text-to-speech syntheses running at once (off the event loop)
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+
+# Unread-message digests are synthesized in chunks of about this many characters and sent one by one
+DIGEST_CHUNK_CHARS = int(os.getenv("DIGEST_CHUNK_CHARS", "400"))
+
+# Cached per-user index of group names used to resolve spoken group choices
+GROUP_INDEX_CACHE_SIZE = int(os.getenv("GROUP_INDEX_CACHE_SIZE", "5000"))
+GROUP_INDEX_TTL = int(os.getenv("GROUP_INDEX_TTL", "600"))  # seconds
+
+# Render all fixed bilingual prompts in the background at startup instead of on first use
+PRERENDER_PROMPTS = os.getenv("PRERENDER_PROMPTS", "true").lower() == "true"
+
+# Number of updates the Application handles at the same time (updates of one chat are handled one at a time, in order)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
+# Role and language of recently seen users, kept in memory (changes are broadcast to every bot instance)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # seconds
+
+# Write-behind ingestion: group messages are buffered in memory and saved in bulk every INGEST_FLUSH_MS
+# or once INGEST_FLUSH_ROWS are waiting (reads of unseen messages flush the buffer first)
+INGEST_WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "false").lower() == "true"
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "200"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+
+# Conversation state (user_data) is kept in Postgres: changed states are saved every STATE_UPDATE_INTERVAL seconds,
+# at most STATE_MAX_USERS states stay in memory and states idle for STATE_IDLE_SECONDS are unloaded
+STATE_UPDATE_INTERVAL = int(os.getenv("STATE_UPDATE_INTERVAL", "10"))
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", "5000"))
+STATE_IDLE_SECONDS = int(os.getenv("STATE_IDLE_SECONDS", "1800"))
+
+# Background sweep of messages already seen by every blind member (in bounded batches)
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "1000"))
+
+# Messages are stored in monthly partitions (see database/partitions.py): PARTITION_PREMAKE_MONTHS are created
+# ahead of time, and with MESSAGE_RETENTION_MONTHS > 0 months older than that are dropped, read or not
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "0"))  # 0 keeps messages forever
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "2"))
+
+# How often upcoming monthly message partitions are created and expired ones dropped
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+
+# How often the hit rates of the in-memory caches are logged (also logged at shutdown)
+CACHE_STATS_INTERVAL_SECONDS = int(os.getenv("CACHE_STATS_INTERVAL_SECONDS", "900"))
 
 
 '''# Directory to store temporary files
@@ -1,182 +1,395 @@
-from database.database_setup import conn, cursor
+from database.database_setup import pool
+from database.ingest_buffer import flush_ingest_buffer
+from database.partitions import ensure_partitions, drop_expired_partitions
+from database.user_cache import user_profiles, invalidate_user, USER_CHANGES_CHANNEL
+
+# Every function borrows a connection from the pool for the duration of the call.
+# Leaving the "async with" block commits the transaction (or rolls it back on error).
 
 # --- User Functions ---
 
-def add_user(user_id, name,username, role, language):
-    cursor.execute('''
-        INSERT INTO users (user_id, name,username, role, language)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT (user_id) DO UPDATE SET
-            name = EXCLUDED.name,
-            username = EXCLUDED.username,
-            role = EXCLUDED.role,
-            language = EXCLUDED.language
-    ''', (user_id, name, username, role, language))
-    conn.commit()
-
-
-def get_user_role(user_id):
-    cursor.execute('SELECT role FROM users WHERE user_id = %s', (user_id,))
-    result = cursor.fetchone()
-    return result[0] if result else None
+# tells every bot instance (including this one) to forget the cached profile, sent on commit
+async def notify_user_changed(conn, user_id):
+    await conn.execute('SELECT pg_notify(%s, %s)', (USER_CHANGES_CHANNEL, str(user_id)))
 
 
-def update_user_role(user_id, new_role):
-    cursor.execute('''
-        UPDATE users SET role = %s WHERE user_id = %s
-    ''', (new_role, user_id))
-    conn.commit()
+async def add_user(user_id, name,username, role, language):
+    async with pool.connection() as conn:
+        await conn.execute('''
+            INSERT INTO users (user_id, name,username, role, language)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET
+                name = EXCLUDED.name,
+                username = EXCLUDED.username,
+                role = EXCLUDED.role,
+                language = EXCLUDED.language
+        ''', (user_id, name, username, role, language))
+        await notify_user_changed(conn, user_id)
+    invalidate_user(user_id)
 
-def update_user_language(user_id, new_language):
-    cursor.execute('''
-        UPDATE users SET language = %s WHERE user_id = %s
-    ''', (new_language, user_id))
-    conn.commit()
 
+# (role, language) of a user, (None, None) if not registered. Read through the user cache.
+async def get_user_profile(user_id):
+    profile = user_profiles.get(user_id)
+    if profile is not None:
+        return profile
 
-def get_user_language(user_id):
-    cursor.execute('SELECT language FROM users WHERE user_id = %s', (user_id,))
-    result = cursor.fetchone()
-    return result[0] if result else None
+    async with pool.connection() as conn:
+        cur = await conn.execute('SELECT role, language FROM users WHERE user_id = %s', (user_id,))
+        result = await cur.fetchone()
+    profile = tuple(result) if result else (None, None)
+    user_profiles.set(user_id, profile)
+    return profile
+
+
+async def get_user_role(user_id):
+    role, _ = await get_user_profile(user_id)
+    return role
+
+
+async def update_user_role(user_id, new_role):
+    async with pool.connection() as conn:
+        await conn.execute('''
+            UPDATE users SET role = %s WHERE user_id = %s
+        ''', (new_role, user_id))
+        await notify_user_changed(conn, user_id)
+    invalidate_user(user_id)
+
+async def update_user_language(user_id, new_language):
+    async with pool.connection() as conn:
+        await conn.execute('''
+            UPDATE users SET language = %s WHERE user_id = %s
+        ''', (new_language, user_id))
+        await notify_user_changed(conn, user_id)
+    invalidate_user(user_id)
+
+
+async def get_user_language(user_id):
+    _, language = await get_user_profile(user_id)
+    return language
 
 
 # --- Group Functions ---
 
-def save_group(group_id, group_name):
-    cursor.execute('''
-        INSERT INTO groups (group_id, group_name)
-        VALUES (%s, %s)
-        ON CONFLICT (group_id) DO UPDATE SET group_name = EXCLUDED.group_name
-        RETURNING group_id
-    ''', (group_id, group_name))
-    result = cursor.fetchone()
-    conn.commit()
+async def save_group(group_id, group_name):
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            INSERT INTO groups (group_id, group_name)
+            VALUES (%s, %s)
+            ON CONFLICT (group_id) DO UPDATE SET group_name = EXCLUDED.group_name
+            RETURNING group_id
+        ''', (group_id, group_name))
+        result = await cur.fetchone()
     return result[0]
 
 
 # to differentiate between multiple blinds using the bot
-def add_user_to_group(user_id, group_id):
+async def add_user_to_group(user_id, group_id):
     # Check user role
-    cursor.execute('SELECT role FROM users WHERE user_id = %s', (user_id,))
-    result = cursor.fetchone()
-    if not result:
+    role = await get_user_role(user_id)
+    if role is None:
         return  # user not registered
-    role = result[0]
 
     if role == 'blind':
-        cursor.execute('''
-            INSERT INTO user_groups (user_id, group_id)
-            VALUES (%s, %s)
-            ON CONFLICT DO NOTHING
-        ''', (user_id, group_id))
-        conn.commit()
+        async with pool.connection() as conn:
+            await conn.execute('''
+                INSERT INTO user_groups (user_id, group_id)
+                VALUES (%s, %s)
+                ON CONFLICT DO NOTHING
+            ''', (user_id, group_id))
 
 
 # to check existing groups for each independent blind
-def get_user_groups(user_id):
-    cursor.execute('''
-        SELECT g.group_id, g.group_name
-        FROM groups g
-        JOIN user_groups ug ON g.group_id = ug.group_id
-        WHERE ug.user_id = %s
-    ''', (user_id,))
-    return cursor.fetchall()
-
+async def get_user_groups(user_id):
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            SELECT g.group_id, g.group_name
+            FROM groups g
+            JOIN user_groups ug ON g.group_id = ug.group_id
+            WHERE ug.user_id = %s
+        ''', (user_id,))
+        return await cur.fetchall()
+
+
+async def get_all_group_names():
+    async with pool.connection() as conn:
+        cur = await conn.execute('SELECT group_name FROM groups')
+        return [row[0] for row in await cur.fetchall()]
+
+
+# groups of this user that have messages stored
+async def get_groups_with_messages(user_id):
+    await flush_ingest_buffer()  # include buffered messages
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            SELECT DISTINCT g.group_id, g.group_name
+            FROM groups g
+            JOIN user_groups ug ON g.group_id = ug.group_id
+            JOIN messages m ON m.group_id = g.group_id
+            WHERE ug.user_id = %s
+              AND m.message_text IS NOT NULL
+              AND TRIM(g.group_name) != ''
+              AND g.group_name != 'None'
+        ''', (user_id,))
+        return await cur.fetchall()
 
 
 # --- Message Functions ---
 
-def save_group_message(group_id, group_name, sender_id, sender_name, message_text):
-    # Step 1: Save the message
-    cursor.execute('''
-        INSERT INTO messages (group_id, group_name, sender_id, sender_name, message_text)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING message_id
-    ''', (group_id, group_name, sender_id, sender_name, message_text))
-    message_id = cursor.fetchone()[0]
-
-    # Step 2: Get all blind users in the group (except the sender)
-    cursor.execute('''
-        SELECT u.user_id
-        FROM users u
-        JOIN user_groups ug ON u.user_id = ug.user_id
-        WHERE ug.group_id = %s AND u.role = 'blind' AND u.user_id != %s
-    ''', (group_id, sender_id))
-    blind_user_ids = cursor.fetchall()
-
-    # Step 3: Insert delivery tracking for each blind user
-    for (user_id,) in blind_user_ids:
-        cursor.execute('''
-            INSERT INTO message_deliveries (message_id, user_id)
-            VALUES (%s, %s)
-        ''', (message_id, user_id))
-
-    conn.commit()
+# Saves an incoming group message in a single round trip:
+# upserts the group, records a blind sender's membership, inserts the message
+# and fans out one delivery row per blind member of the group (except the sender).
+# group_name=None keeps the stored name. With require_recipients=True nothing is saved
+# when no other blind user is in the group, with sender_seen=True the sender gets a seen delivery.
+async def ingest_group_message(group_id, group_name, sender_id, sender_name, message_text, created_at=None,
+                               require_recipients=False, sender_seen=False):
+    async with pool.connection() as conn:
+        await conn.execute('''
+            WITH g AS (
+                INSERT INTO groups (group_id, group_name)
+                VALUES (%(group_id)s, %(group_name)s)
+                ON CONFLICT (group_id) DO UPDATE SET group_name = COALESCE(EXCLUDED.group_name, groups.group_name)
+                RETURNING group_id, group_name
+            ),
+            membership AS (
+                INSERT INTO user_groups (user_id, group_id)
+                SELECT u.user_id, g.group_id
+                FROM users u, g
+                WHERE u.user_id = %(sender_id)s AND u.role = 'blind'
+                ON CONFLICT DO NOTHING
+            ),
+            recipients AS (
+                SELECT ug.user_id
+                FROM user_groups ug
+                JOIN users u ON u.user_id = ug.user_id
+                WHERE ug.group_id = %(group_id)s AND u.role = 'blind' AND u.user_id != %(sender_id)s
+            ),
+            msg AS (
+                INSERT INTO messages (group_id, group_name, sender_id, sender_name, message_text, created_at)
+                SELECT g.group_id, g.group_name, %(sender_id)s, %(sender_name)s, %(message_text)s,
+                       COALESCE(%(created_at)s::timestamp, now() AT TIME ZONE 'utc')
+                FROM g
+                WHERE NOT %(require_recipients)s OR EXISTS (SELECT 1 FROM recipients)
+                RETURNING message_id, created_at
+            )
+            INSERT INTO message_deliveries (message_id, message_created_at, user_id, seen)
+            SELECT msg.message_id, msg.created_at, r.user_id, FALSE FROM msg, recipients r
+            UNION ALL
+            SELECT msg.message_id, msg.created_at, %(sender_id)s, TRUE FROM msg WHERE %(sender_seen)s
+        ''', {
+            "group_id": group_id,
+            "group_name": group_name,
+            "sender_id": sender_id,
+            "sender_name": sender_name,
+            "message_text": message_text,
+            "created_at": created_at,
+            "require_recipients": require_recipients,
+            "sender_seen": sender_seen,
+        })
 
 
 
 # get the unseen messages by an independent blind
-def get_unSeen_messages(user_id, group_id):
-    cursor.execute('''
-        SELECT m.sender_name, m.message_text, m.message_id
-        FROM messages m
-        JOIN message_deliveries d ON m.message_id = d.message_id
-        WHERE d.user_id = %s AND d.seen = FALSE AND m.group_id = %s
-        ORDER BY m.created_at ASC
-    ''', (user_id, group_id))
-    return cursor.fetchall()
+async def get_unSeen_messages(user_id, group_id):
+    await flush_ingest_buffer()  # include buffered messages
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            SELECT m.sender_name, m.message_text, m.message_id
+            FROM messages m
+            JOIN message_deliveries d ON m.message_id = d.message_id AND m.created_at = d.message_created_at
+            WHERE d.user_id = %s AND d.seen = FALSE AND m.group_id = %s
+            ORDER BY m.created_at ASC, m.message_id ASC
+        ''', (user_id, group_id))
+        return await cur.fetchall()
 
 # set seen messages as delivered in message_deliveries table
-def mark_messages_as_Seen(user_id, message_ids):
+# and delete those of them that every blind member has now seen (same transaction)
+async def mark_messages_as_Seen(user_id, message_ids):
     if not message_ids:
         return  # No messages to mark
 
-    cursor.executemany('''
-        UPDATE message_deliveries
-        SET seen = TRUE
-        WHERE user_id = %s AND message_id = %s
-    ''', [(user_id, message_id) for message_id in message_ids])
-    conn.commit()
-
-    # ✅ Trigger cleanup immediately after marking delivered
-    delete_fully_delivered_messages()
+    message_ids = list(message_ids)
+    async with pool.connection() as conn:
+        await conn.execute('''
+            UPDATE message_deliveries
+            SET seen = TRUE
+            WHERE user_id = %s AND message_id = ANY(%s) AND seen = FALSE
+        ''', (user_id, message_ids))
+
+        # ✅ Cleanup limited to the messages just marked (with their deliveries)
+        await conn.execute('''
+            WITH done AS (
+                DELETE FROM messages m
+                WHERE m.message_id = ANY(%s)
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM message_deliveries d
+                      JOIN users u ON d.user_id = u.user_id
+                      WHERE d.message_id = m.message_id AND d.message_created_at = m.created_at
+                        AND u.role = 'blind' AND d.seen = FALSE
+                  )
+                RETURNING m.message_id, m.created_at
+            )
+            DELETE FROM message_deliveries d
+            USING done
+            WHERE d.message_id = done.message_id AND d.message_created_at = done.created_at
+        ''', (message_ids,))
+
+
+# delete messaage when seen by all blind in the same group.
+# Runs periodically (see handlers_call.py) to catch messages the incremental cleanup missed,
+# e.g. when two blind users marked the same message at the same time. Returns the number deleted.
+async def delete_fully_delivered_messages(limit=1000):
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            WITH done AS (
+                DELETE FROM messages
+                WHERE (message_id, created_at) IN (
+                    SELECT m.message_id, m.created_at
+                    FROM messages m
+                    WHERE EXISTS (
+                        SELECT 1
+                        FROM message_deliveries d
+                        JOIN users u ON d.user_id = u.user_id
+                        WHERE d.message_id = m.message_id AND d.message_created_at = m.created_at
+                          AND u.role = 'blind'
+                    )
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM message_deliveries d
+                        JOIN users u ON d.user_id = u.user_id
+                        WHERE d.message_id = m.message_id AND d.message_created_at = m.created_at
+                          AND u.role = 'blind' AND d.seen = FALSE
+                    )
+                    LIMIT %s
+                )
+                RETURNING message_id, created_at
+            ),
+            deliveries AS (
+                DELETE FROM message_deliveries d
+                USING done
+                WHERE d.message_id = done.message_id AND d.message_created_at = done.created_at
+            )
+            SELECT COUNT(*) FROM done
+        ''', (limit,))
+        return (await cur.fetchone())[0]
+
+
+# pre-creates the coming monthly partitions and drops the expired ones, returns the dropped partition names
+async def maintain_message_partitions():
+    async with pool.connection() as conn:
+        await ensure_partitions(conn)
+        return await drop_expired_partitions(conn)
+
+
+async def get_user_id_by_username(username):
+    username = username.lstrip('@')  # Remove '@' if it exists
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+            SELECT user_id FROM users WHERE username = %s
+        ''', (username,))
+        result = await cur.fetchone()
+    return result[0] if result else None
 
 
 
+async def is_user_in_group(user_id: int, group_id: int) -> bool:
+    async with pool.connection() as conn:
+        cur = await conn.execute('''
+                SELECT 1 FROM user_groups
+                WHERE user_id = %s AND group_id = %s
+                LIMIT 1
+            ''', (user_id, group_id))
+        result = await cur.fetchone()
+    return result is not None
 
 
-# delete messaage when seen by all blind in the same group
-def delete_fully_delivered_messages():
-    cursor.execute('''
-        DELETE FROM messages
-        WHERE message_id IN (
-            SELECT m.message_id
-            FROM messages m
-            JOIN message_deliveries d ON m.message_id = d.message_id
-            JOIN users u ON d.user_id = u.user_id
-            WHERE u.role = 'blind'
-            GROUP BY m.message_id
-            HAVING BOOL_AND(d.seen) = TRUE
-        )
-    ''')
-    conn.commit()
 
+# --- Transcript Functions ---
 
-def get_user_id_by_username(username):
-    username = username.lstrip('@')  # Remove '@' if it exists
-    cursor.execute('''
-        SELECT user_id FROM users WHERE username = %s
-    ''', (username,))
-    result = cursor.fetchone()
+async def get_transcript(file_unique_id):
+    async with pool.connection() as conn:
+        cur = await conn.execute('SELECT transcript FROM transcripts WHERE file_unique_id = %s', (file_unique_id,))
+        result = await cur.fetchone()
     return result[0] if result else None
 
 
-
-def is_user_in_group(user_id: int, group_id: int) -> bool:
-    cursor.execute('''
-            SELECT 1 FROM user_groups
-            WHERE user_id = %s AND group_id = %s
-            LIMIT 1
-        ''', (user_id, group_id))
-    result = cursor.fetchone()
-    return result is not None
+async def save_transcript(file_unique_id, transcript):
+    async with pool.connection() as conn:
+        await conn.execute('''
+            INSERT INTO transcripts (file_unique_id, transcript)
+            VALUES (%s, %s)
+            ON CONFLICT (file_unique_id) DO UPDATE SET transcript = EXCLUDED.transcript
+        ''', (file_unique_id, transcript))
+
+
+# Benchmark: python -m database.database_functions [messages] [blind members]
+# saves messages to a scratch group with the single-round-trip ingest CTE and with the previous path
+# (save_group + add_user_to_group + insert, select the blind members, one delivery insert each), then removes them.
+# Run it against a copy of the database: the gap grows with the network latency to Postgres.
+if __name__ == "__main__":
+    import sys
+    import time
+    import asyncio
+    from database.database_setup import open_pool, close_pool, setup_database
+
+    MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    MEMBERS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    GROUP_ID = -999_000_000_001
+    USER_IDS = [-999_000_000_001 - i for i in range(MEMBERS + 1)]  # the first one is the (sighted) sender
+
+    async def previous_ingest(group_id, group_name, sender_id, sender_name, message_text):
+        await save_group(group_id, group_name)
+        await add_user_to_group(sender_id, group_id)
+        async with pool.connection() as conn:
+            cur = await conn.execute('''
+                INSERT INTO messages (group_id, group_name, sender_id, sender_name, message_text)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING message_id, created_at
+            ''', (group_id, group_name, sender_id, sender_name, message_text))
+            message_id, created_at = await cur.fetchone()
+
+            cur = await conn.execute('''
+                SELECT u.user_id
+                FROM users u
+                JOIN user_groups ug ON u.user_id = ug.user_id
+                WHERE ug.group_id = %s AND u.role = 'blind' AND u.user_id != %s
+            ''', (group_id, sender_id))
+            for (user_id,) in await cur.fetchall():
+                await conn.execute('''
+                    INSERT INTO message_deliveries (message_id, message_created_at, user_id)
+                    VALUES (%s, %s, %s)
+                ''', (message_id, created_at, user_id))
+
+    async def cleanup():
+        async with pool.connection() as conn:
+            await conn.execute('DELETE FROM message_deliveries WHERE user_id = ANY(%s)', (USER_IDS,))
+            await conn.execute('DELETE FROM messages WHERE group_id = %s', (GROUP_ID,))
+            await conn.execute('DELETE FROM user_groups WHERE group_id = %s', (GROUP_ID,))
+            await conn.execute('DELETE FROM groups WHERE group_id = %s', (GROUP_ID,))
+            await conn.execute('DELETE FROM users WHERE user_id = ANY(%s)', (USER_IDS,))
+
+    async def main():
+        await open_pool()
+        await setup_database()
+        await maintain_message_partitions()
+        try:
+            await cleanup()
+            await add_user(USER_IDS[0], "bench sender", None, "sighted", "english")
+            await save_group(GROUP_ID, "bench group")
+            for user_id in USER_IDS[1:]:
+                await add_user(user_id, "bench member", None, "blind", "english")
+                await add_user_to_group(user_id, GROUP_ID)
+
+            for name, ingest in [("previous path", previous_ingest), ("ingest CTE", ingest_group_message)]:
+                start = time.perf_counter()
+                for i in range(MESSAGES):
+                    await ingest(GROUP_ID, "bench group", USER_IDS[0], "bench sender", f"message {i}")
+                elapsed = time.perf_counter() - start
+                print(f"{name}: {1000 * elapsed / MESSAGES:.2f} ms per message "
+                      f"({MESSAGES} messages, {MEMBERS} blind members)")
+        finally:
+            await cleanup()
+            await close_pool()
+
+    asyncio.run(main())
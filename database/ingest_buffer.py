@@ -0,0 +1,122 @@
+import asyncio
+from config import INGEST_WRITE_BEHIND, INGEST_FLUSH_MS, INGEST_FLUSH_ROWS
+from database.database_setup import pool
+from database.partitions import utc_now
+
+# Write-behind ingestion: group messages are queued in memory and saved in bulk with COPY
+
+# (group_id, group_name, sender_id, sender_name, message_text, created_at) waiting to be flushed
+pending_rows = []
+flush_lock = None
+flush_task = None
+
+
+def get_flush_lock():
+    global flush_lock
+    if flush_lock is None:
+        flush_lock = asyncio.Lock()
+    return flush_lock
+
+
+async def enqueue_group_message(group_id, group_name, sender_id, sender_name, message_text, created_at=None):
+    # without a message date, created_at is taken now so messages keep their order relative to directly saved ones
+    pending_rows.append((group_id, group_name, sender_id, sender_name, message_text, created_at or utc_now()))
+    if len(pending_rows) >= INGEST_FLUSH_ROWS:
+        await flush_ingest_buffer()
+
+
+# readers call this before reading: the lock is taken even when nothing is pending, because a flush
+# in progress has already emptied pending_rows and its rows are only readable once it has committed
+async def flush_ingest_buffer():
+    async with get_flush_lock():
+        rows = pending_rows[:]
+        pending_rows.clear()
+        if not rows:
+            return
+
+        try:
+            async with pool.connection() as conn:
+                await conn.execute('''
+                    CREATE TEMP TABLE IF NOT EXISTS ingest_staging (
+                        seq INT,
+                        group_id BIGINT,
+                        group_name TEXT,
+                        sender_id BIGINT,
+                        sender_name TEXT,
+                        message_text TEXT,
+                        created_at TIMESTAMP
+                    ) ON COMMIT DELETE ROWS
+                ''')
+
+                async with conn.cursor() as cur:
+                    async with cur.copy('''
+                        COPY ingest_staging (seq, group_id, group_name, sender_id, sender_name, message_text, created_at)
+                        FROM STDIN
+                    ''') as copy:
+                        for seq, row in enumerate(rows):
+                            await copy.write_row((seq, *row))
+
+                # Groups and memberships first, so blind senders in this batch receive the later messages
+                await conn.execute('''
+                    WITH g AS (
+                        INSERT INTO groups (group_id, group_name)
+                        SELECT DISTINCT ON (group_id) group_id, group_name
+                        FROM ingest_staging
+                        ORDER BY group_id, seq DESC
+                        ON CONFLICT (group_id) DO UPDATE SET group_name = EXCLUDED.group_name
+                    )
+                    INSERT INTO user_groups (user_id, group_id)
+                    SELECT DISTINCT s.sender_id, s.group_id
+                    FROM ingest_staging s
+                    JOIN users u ON u.user_id = s.sender_id
+                    WHERE u.role = 'blind'
+                    ON CONFLICT DO NOTHING
+                ''')
+
+                # Messages and their deliveries to every other blind member, set-based
+                await conn.execute('''
+                    WITH msg AS (
+                        INSERT INTO messages (group_id, group_name, sender_id, sender_name, message_text, created_at)
+                        SELECT group_id, group_name, sender_id, sender_name, message_text, created_at
+                        FROM ingest_staging
+                        ORDER BY seq
+                        RETURNING message_id, group_id, sender_id, created_at
+                    )
+                    INSERT INTO message_deliveries (message_id, message_created_at, user_id)
+                    SELECT msg.message_id, msg.created_at, ug.user_id
+                    FROM msg
+                    JOIN user_groups ug ON ug.group_id = msg.group_id
+                    JOIN users u ON u.user_id = ug.user_id
+                    WHERE u.role = 'blind' AND u.user_id != msg.sender_id
+                ''')
+            print(f"[INGEST] Flushed {len(rows)} messages")
+
+        except Exception as e:
+            # keep the rows for the next flush
+            pending_rows[:0] = rows
+            print(f"[ERROR] Failed to flush {len(rows)} buffered messages: {e}")
+            raise
+
+
+async def flush_periodically():
+    while True:
+        await asyncio.sleep(INGEST_FLUSH_MS / 1000)
+        try:
+            await flush_ingest_buffer()
+        except Exception:
+            pass  # already logged, retried on the next tick
+
+
+def start_ingest_buffer():
+    global flush_task
+    if INGEST_WRITE_BEHIND and flush_task is None:
+        flush_task = asyncio.create_task(flush_periodically())
+
+
+# stop the periodic flush and write everything that is still buffered
+async def stop_ingest_buffer():
+    global flush_task
+    if flush_task is not None:
+        flush_task.cancel()
+        flush_task = None
+    await flush_ingest_buffer()
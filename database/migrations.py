@@ -0,0 +1,204 @@
+# Versioned schema migrations.
+# Each migration is (version, description, steps) where a step is an SQL statement
+# or an async function taking the connection. Applied versions are recorded in schema_migrations.
+# Never edit a migration that has been released, add a new one instead.
+from config import PARTITION_PREMAKE_MONTHS
+from database.partitions import utc_now, month_start, add_months, create_month_partitions, create_default_partitions
+
+
+# Rebuilds messages and message_deliveries as tables partitioned by month and copies the existing rows.
+# Deliveries carry their message's created_at (message_created_at) so both tables share the same partitions,
+# there is no foreign key between them so a month can be dropped at once.
+async def partition_message_tables(conn):
+    await conn.execute('ALTER TABLE message_deliveries RENAME TO message_deliveries_old')
+    await conn.execute('ALTER TABLE message_deliveries_old RENAME CONSTRAINT message_deliveries_pkey TO message_deliveries_old_pkey')
+    await conn.execute('DROP INDEX IF EXISTS idx_message_deliveries_unseen')
+    await conn.execute('ALTER TABLE messages RENAME TO messages_old')
+    await conn.execute('ALTER TABLE messages_old RENAME CONSTRAINT messages_pkey TO messages_old_pkey')
+    await conn.execute('DROP INDEX IF EXISTS idx_messages_group_created')
+
+    await conn.execute('''
+        CREATE TABLE messages (
+            message_id BIGINT NOT NULL DEFAULT nextval('messages_message_id_seq'),
+            group_id BIGINT REFERENCES groups(group_id) ON DELETE CASCADE,
+            group_name TEXT,
+            sender_id BIGINT,
+            sender_name TEXT,
+            message_text TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (message_id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    ''')
+    await conn.execute('''
+        CREATE TABLE message_deliveries (
+            message_id BIGINT NOT NULL,
+            message_created_at TIMESTAMP NOT NULL,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            seen BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (message_id, message_created_at, user_id)
+        ) PARTITION BY RANGE (message_created_at)
+    ''')
+    await conn.execute('''
+        CREATE INDEX idx_message_deliveries_unseen
+            ON message_deliveries (user_id, message_id)
+            WHERE seen = FALSE
+    ''')
+    await conn.execute('''
+        CREATE INDEX idx_messages_group_created
+            ON messages (group_id, created_at)
+    ''')
+
+    # partitions for every month that already has messages, up to the pre-created ones
+    cur = await conn.execute('SELECT MIN(created_at) FROM messages_old')
+    oldest = (await cur.fetchone())[0]
+    today = utc_now()
+    first_month = month_start(oldest) if oldest else month_start(today)
+    await create_month_partitions(conn, min(first_month, month_start(today)), add_months(month_start(today), PARTITION_PREMAKE_MONTHS))
+
+    await conn.execute('''
+        INSERT INTO messages (message_id, group_id, group_name, sender_id, sender_name, message_text, created_at)
+        SELECT message_id, group_id, group_name, sender_id, sender_name, message_text, COALESCE(created_at, now() AT TIME ZONE 'utc')
+        FROM messages_old
+    ''')
+    await conn.execute('''
+        INSERT INTO message_deliveries (message_id, message_created_at, user_id, seen)
+        SELECT d.message_id, COALESCE(m.created_at, now() AT TIME ZONE 'utc'), d.user_id, d.seen
+        FROM message_deliveries_old d
+        JOIN messages_old m ON m.message_id = d.message_id
+    ''')
+
+    # keep the id sequence when the old table goes away
+    await conn.execute('ALTER SEQUENCE messages_message_id_seq AS BIGINT OWNED BY messages.message_id')
+    await conn.execute('DROP TABLE message_deliveries_old')
+    await conn.execute('DROP TABLE messages_old')
+
+
+MIGRATIONS = [
+    (1, "initial tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            name TEXT,
+            username TEXT,
+            role TEXT,  -- e.g., 'blind', 'sighted'
+            language TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS groups (
+            group_id BIGINT PRIMARY KEY,
+            group_name TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_groups (
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            group_id BIGINT REFERENCES groups(group_id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id, group_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id SERIAL PRIMARY KEY,
+            group_id BIGINT REFERENCES groups(group_id) ON DELETE CASCADE,
+            group_name TEXT,
+            sender_id BIGINT,
+            sender_name TEXT,
+            message_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 💡 This tracks which users have received each message
+        '''
+        CREATE TABLE IF NOT EXISTS message_deliveries (
+            message_id BIGINT REFERENCES messages(message_id) ON DELETE CASCADE,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            seen BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (message_id, user_id)
+        )
+        ''',
+        # Transcripts of voice notes, keyed by Telegram file_unique_id
+        '''
+        CREATE TABLE IF NOT EXISTS transcripts (
+            file_unique_id TEXT PRIMARY KEY,
+            transcript TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+
+    (2, "hot path indexes", [
+        # get_unSeen_messages: a blind user's unseen deliveries (only unseen rows are indexed)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_message_deliveries_unseen
+            ON message_deliveries (user_id, message_id)
+            WHERE seen = FALSE
+        ''',
+        # messages of a group in created_at order
+        '''
+        CREATE INDEX IF NOT EXISTS idx_messages_group_created
+            ON messages (group_id, created_at)
+        ''',
+        # get_user_id_by_username (/addblind)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_username
+            ON users (username)
+        ''',
+        # fan-out of a new message to the blind members of its group
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_groups_group
+            ON user_groups (group_id)
+        ''',
+    ]),
+
+    (3, "partition messages and deliveries by month", [
+        partition_message_tables,
+    ]),
+
+    (4, "conversation state", [
+        # context.user_data of each user (see database/persistence.py)
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id BIGINT PRIMARY KEY,
+            data JSONB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+
+    (5, "default message partitions", [
+        # messages of a month without a partition are kept instead of failing the insert
+        create_default_partitions,
+    ]),
+]
+
+
+async def run_migrations(conn):
+    # only one bot instance migrates at a time (lock released at commit)
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('hearme_schema_migrations'))")
+
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur = await conn.execute('SELECT version FROM schema_migrations')
+    applied = {row[0] for row in await cur.fetchall()}
+
+    for version, description, steps in MIGRATIONS:
+        if version in applied:
+            continue
+
+        for step in steps:
+            if callable(step):
+                await step(conn)
+            else:
+                await conn.execute(step)
+
+        await conn.execute(
+            'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+            (version, description),
+        )
+        print(f"✅ Applied migration {version}: {description}")
@@ -0,0 +1,114 @@
+import re
+import datetime
+from psycopg import sql
+from config import MESSAGE_RETENTION_MONTHS, PARTITION_PREMAKE_MONTHS
+
+# messages and message_deliveries are partitioned by month (messages.created_at / message_deliveries.message_created_at).
+# Expired months are removed by dropping their partitions instead of deleting rows.
+# A DEFAULT partition takes the rows of months that have no partition yet (e.g. when the maintenance job
+# didn't run), they are moved into the month's partition when it is created.
+# created_at is naive UTC everywhere (Telegram's message date, utc_now() or the column default), so
+# messages saved by different paths keep their order and fall into the same month whatever the host timezone.
+
+# table -> partition key
+PARTITIONED_TABLES = {'message_deliveries': 'message_created_at', 'messages': 'created_at'}
+PARTITION_SUFFIX = re.compile(r'_(\d{4})_(\d{2})$')
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+async def table_exists(conn, name):
+    cur = await conn.execute('SELECT to_regclass(%s) IS NOT NULL', (name,))
+    return (await cur.fetchone())[0]
+
+
+# the month's partition is built next to the table, filled with the month's rows from the default
+# partition, then attached (creating it directly as a partition fails while the default holds such rows)
+async def create_month_partition(conn, table, month):
+    name = partition_name(table, month)
+    if await table_exists(conn, name):
+        return
+
+    key = PARTITIONED_TABLES[table]
+    start, end = sql.Literal(month.isoformat()), sql.Literal(add_months(month, 1).isoformat())
+    await conn.execute(sql.SQL('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)').format(
+        sql.Identifier(name), sql.Identifier(table),
+    ))
+    if await table_exists(conn, default_partition_name(table)):
+        await conn.execute(sql.SQL(
+            'WITH moved AS (DELETE FROM {} WHERE {} >= {} AND {} < {} RETURNING *) INSERT INTO {} SELECT * FROM moved'
+        ).format(
+            sql.Identifier(default_partition_name(table)),
+            sql.Identifier(key), start, sql.Identifier(key), end,
+            sql.Identifier(name),
+        ))
+    await conn.execute(sql.SQL('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})').format(
+        sql.Identifier(table), sql.Identifier(name), start, end,
+    ))
+
+
+# create the monthly partitions of both tables from first_month to last_month (inclusive)
+async def create_month_partitions(conn, first_month, last_month):
+    month = month_start(first_month)
+    while month <= last_month:
+        for table in PARTITIONED_TABLES:
+            await create_month_partition(conn, table, month)
+        month = add_months(month, 1)
+
+
+async def create_default_partitions(conn):
+    for table in PARTITIONED_TABLES:
+        await conn.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT').format(
+            sql.Identifier(default_partition_name(table)), sql.Identifier(table),
+        ))
+
+
+# current month and the next PARTITION_PREMAKE_MONTHS months
+async def ensure_partitions(conn, today=None):
+    current = month_start(today or utc_now())
+    await create_month_partitions(conn, current, add_months(current, PARTITION_PREMAKE_MONTHS))
+
+
+# drop the partitions that ended more than MESSAGE_RETENTION_MONTHS months ago, returns their names
+async def drop_expired_partitions(conn, today=None):
+    if MESSAGE_RETENTION_MONTHS <= 0:
+        return []
+
+    cutoff = add_months(month_start(today or utc_now()), -MESSAGE_RETENTION_MONTHS)
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        cur = await conn.execute('''
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s
+        ''', (table,))
+        for (name,) in await cur.fetchall():
+            match = PARTITION_SUFFIX.search(name)
+            if not match:
+                continue
+            month = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+            if add_months(month, 1) <= cutoff:
+                await conn.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(sql.Identifier(name)))
+                dropped.append(name)
+    return dropped
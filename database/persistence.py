@@ -0,0 +1,187 @@
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from telegram.ext import BasePersistence, PersistenceInput
+from database.database_setup import pool
+
+
+# Keeps context.user_data (the conversation state machine) in the conversation_state table.
+# - Nothing is loaded at startup, a user's state is loaded on their first update (refresh_user_data).
+# - Only states that changed since they were last loaded/saved are written, all in one batch per persistence run.
+# - At most max_users states stay in memory: the least recently active (or idle for idle_seconds)
+#   are saved and cleared, and loaded again on their next update.
+# chat_data, bot_data, callback data and conversations are not used by the bot and aren't stored.
+class PostgresPersistence(BasePersistence):
+    def __init__(self, update_interval=10, max_users=5000, idle_seconds=1800):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+
+        self._active = OrderedDict()  # user_id -> (user_data, last update time), least recently active first
+        self._snapshots = {}  # user_id -> JSON of the state as stored in the database
+        self._loading = {}  # user_id -> task loading the state
+        self._dirty = {}  # user_id -> JSON waiting to be written
+        self._write_lock = asyncio.Lock()
+
+        self.loads = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _serialize(data):
+        return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+    # --- user_data ---
+
+    async def get_user_data(self):
+        return {}  # loaded lazily (the pool isn't open yet when this is called)
+
+    async def refresh_user_data(self, user_id, user_data):
+        self._active[user_id] = (user_data, time.monotonic())
+        self._active.move_to_end(user_id)
+
+        if user_id not in self._snapshots:
+            loading = self._loading.get(user_id)
+            if loading is None:
+                loading = self._loading[user_id] = asyncio.ensure_future(self._load(user_id, user_data))
+            await asyncio.shield(loading)
+
+        await self._evict()
+
+    async def _load(self, user_id, user_data):
+        try:
+            async with pool.connection() as conn:
+                cur = await conn.execute('SELECT data FROM conversation_state WHERE user_id = %s', (user_id,))
+                result = await cur.fetchone()
+            stored = result[0] if result else {}
+            for key, value in stored.items():
+                user_data.setdefault(key, value)
+            self._snapshots[user_id] = self._serialize(stored)
+            self.loads += 1
+        finally:
+            self._loading.pop(user_id, None)
+
+    async def update_user_data(self, user_id, data):
+        if user_id not in self._snapshots:
+            return  # evicted, its state was saved then
+
+        serialized = self._serialize(data)
+        if self._snapshots[user_id] != serialized:
+            self._dirty[user_id] = serialized
+            await self._write_dirty()
+
+    async def _write_dirty(self):
+        await asyncio.sleep(0)  # let the other update_user_data calls of this run add their state first
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            rows = list(self._dirty.items())
+            self._dirty.clear()
+
+            try:
+                async with pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.executemany('''
+                            INSERT INTO conversation_state (user_id, data, updated_at)
+                            VALUES (%s, %s::jsonb, CURRENT_TIMESTAMP)
+                            ON CONFLICT (user_id) DO UPDATE SET
+                                data = EXCLUDED.data,
+                                updated_at = EXCLUDED.updated_at
+                        ''', rows)
+            except Exception as e:
+                # written again on the next run (unless a newer state is already waiting)
+                for user_id, serialized in rows:
+                    self._dirty.setdefault(user_id, serialized)
+                print(f"[ERROR] Failed to save conversation state of {len(rows)} users: {e}")
+                return
+
+            for user_id, serialized in rows:
+                if user_id in self._snapshots:
+                    self._snapshots[user_id] = serialized
+            self.writes += len(rows)
+
+    async def _evict(self):
+        now = time.monotonic()
+        evicted = []
+        while self._active:
+            user_id, (user_data, last_seen) = next(iter(self._active.items()))
+            if len(self._active) <= self.max_users and now - last_seen < self.idle_seconds:
+                break
+            if user_id in self._loading:
+                break  # just became active
+            del self._active[user_id]
+            evicted.append((user_id, user_data))
+
+        if not evicted:
+            return
+
+        for user_id, user_data in evicted:
+            serialized = self._serialize(user_data)
+            if user_id in self._snapshots and self._snapshots[user_id] != serialized:
+                self._dirty[user_id] = serialized
+        await self._write_dirty()
+
+        for user_id, user_data in evicted:
+            if user_id in self._dirty:
+                continue  # not saved, keep it in memory until it is
+            user_data.clear()
+            self._snapshots.pop(user_id, None)
+            self.evictions += 1
+
+    async def drop_user_data(self, user_id):
+        self._active.pop(user_id, None)
+        self._snapshots.pop(user_id, None)
+        self._dirty.pop(user_id, None)
+        async with pool.connection() as conn:
+            await conn.execute('DELETE FROM conversation_state WHERE user_id = %s', (user_id,))
+
+    async def flush(self):
+        await self._write_dirty()
+
+    def get_stats(self):
+        return {
+            "users_in_memory": len(self._snapshots),
+            "dirty": len(self._dirty),
+            "loads": self.loads,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+    # --- not stored ---
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
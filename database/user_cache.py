@@ -0,0 +1,53 @@
+import asyncio
+import psycopg
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from services.ttl_cache import TTLCache
+from database.database_setup import DATABASE_URL
+
+# Other bot instances are told about profile changes with NOTIFY on this channel (payload: user_id)
+USER_CHANGES_CHANNEL = 'hearme_user_changed'
+
+# (role, language) of recently seen users, so one update doesn't query the users table several times
+user_profiles = TTLCache(max_size=USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL)
+listener_task = None
+
+
+def invalidate_user(user_id):
+    user_profiles.pop(user_id)
+
+
+def get_user_cache_stats():
+    return user_profiles.get_stats()
+
+
+# Keeps a dedicated connection LISTENing for profile changes made by any instance
+async def listen_for_user_changes():
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                await conn.execute(f'LISTEN {USER_CHANGES_CHANNEL}')
+                # changes made while we weren't listening are unknown
+                user_profiles.clear()
+                async for notify in conn.notifies():
+                    try:
+                        invalidate_user(int(notify.payload))
+                    except ValueError:
+                        user_profiles.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] User change listener disconnected: {e}")
+            await asyncio.sleep(5)
+
+
+def start_user_cache_listener():
+    global listener_task
+    if listener_task is None:
+        listener_task = asyncio.create_task(listen_for_user_changes())
+
+
+def stop_user_cache_listener():
+    global listener_task
+    if listener_task is not None:
+        listener_task.cancel()
+        listener_task = None
@@ -1,12 +1,16 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from database.database_functions import get_user_role, get_user_language, add_user_to_group, get_user_id_by_username, is_user_in_group, save_group
-from database.database_setup import cursor
+from database.database_functions import get_all_group_names, get_groups_with_messages
 from services.tts_service import text_to_speech
+from services.prompt_library import reply_prompt
 from services.stt_service import speech_to_text
-from handlers.helper_functions import fuzzy_language_match, normalize_text
+from services.model_registry import models
+from handlers.helper_functions import normalize_text
+from handlers.intents import voice_commands
 from handlers.group_handlers import handle_group_message, handle_after_ask, handle_voice_reply, handle_group_choice, handle_switch_to_command
 from handlers.onboarding_handlers import set_role, reply_after_language
+from services.group_index import invalidate_group_index, note_group_activity
 
 # --- Voice Handler ---
 async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -20,6 +24,12 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.message.from_user.id
         chat_type = update.message.chat.type
 
+        # private voice notes are answered right away, so tell the user if Whisper is still loading
+        # (group voice notes just wait for it)
+        if chat_type == "private" and not models.ensure_ready("whisper"):
+            await reply_prompt(update.message, "model_loading", await get_user_language(user_id))
+            return
+
         transcribed = await speech_to_text(voice)
         print(f"[DEBUG] Voice transcribed: {transcribed}")
         normalized = normalize_text(transcribed)
@@ -32,14 +42,7 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             #await set_role(update, context, normalized)
             #return
 
-        role = get_user_role(user_id)
-        # Fuzzy keyword lists for commands (English & Arabic)
-        check_keywords = ["check", "شيك", "تحقق", "/check"]
-        group_keywords = ["group", "/group", "مجموعة"]
-        switch_keywords = ["switch to", "انتقل الى", "حول الى", "انتقل إلى"]
-        help_keywords = ["help", "مساعدة"]
-        settings_keywords = ["settings", "اعدادات"]
-
+        role = await get_user_role(user_id)
 
         if context.user_data.get("awaiting_language"):
                 await reply_after_language(update, context, normalized)
@@ -48,34 +51,29 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Handle commands only for blind users in private chat
         elif role == "blind" and chat_type == "private":
-            matched_check = fuzzy_language_match(normalized, check_keywords)
-            matched_group = fuzzy_language_match(normalized, group_keywords)
-            matched_switch = fuzzy_language_match(normalized, switch_keywords)
-            matched_help = fuzzy_language_match(normalized, help_keywords)
-            matched_settings = fuzzy_language_match(normalized, settings_keywords)
-
+            # best matching voice command (keywords in handlers/intents.py)
+            intent = voice_commands.match(normalized)
 
-            
-            if matched_check:
+            if intent == "check":
                 print("[DEBUG] Voice command matched: /check")
                 await check_messages(update, context)
                 return
-            elif matched_help:
+            elif intent == "help":
                 print("[DEBUG] Voice command matched: /help")
                 await handle_help_command(update, context)
                 return
             elif context.user_data.get("awaiting_group_choice"):
                 await handle_group_choice(update, context)
-            elif matched_switch or normalized.startswith("switch to"):
+            elif intent == "switch" or normalized.startswith("switch to"):
                 print("[DEBUG] Voice command matched: switch to")
                 handled = await handle_switch_to_command(update, context, normalized)
                 if handled:
                     return
-            elif matched_group:
+            elif intent == "group":
                 print("[DEBUG] Voice command matched: /group")
                 await group_command(update, context)
                 return
-            elif matched_settings:
+            elif intent == "settings":
                 print("[DEBUG] Voice command matched: /settings")
                 await handle_settings_command(update, context)
                 return
@@ -86,9 +84,7 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await handle_voice_reply(update, context)     
             else:
                 print(f"[DEBUG] Unmatched voice command: {normalized}")
-                await update.message.reply_voice(
-                    await text_to_speech("Unexpected Input. Please use a command or follow the instructions.")
-                )
+                await reply_prompt(update.message, "unexpected_input")
 
         elif chat_type in ["group", "supergroup"]:
             await handle_group_message(update, context)
@@ -98,9 +94,7 @@ async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     except Exception as e:
         print(f"[ERROR] Failed in voice_handler: {e}")
-        await update.message.reply_voice(
-            await text_to_speech("There was a problem understanding your voice. Try again.")
-        )
+        await reply_prompt(update.message, "voice_problem")
 
 
 # to get all available groups
@@ -108,23 +102,20 @@ async def group_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     # Get user's preferred language
-    language = get_user_language(user_id) or "english"
+    language = await get_user_language(user_id) or "english"
 
-    cursor.execute("SELECT role FROM users WHERE user_id = %s", (user_id,))
-    result = cursor.fetchone()
+    role = await get_user_role(user_id)
 
-    if not result or result[0] != 'blind':
+    if role != 'blind':
         if language == "arabic":
             await update.message.reply_text("هذا الأمر متاح فقط للمستخدمين المكفوفين.")
         else:
             await update.message.reply_text("This command is only for blind users.")
         return
     
-    cursor.execute('''SELECT group_name FROM groups''')
-    groups = cursor.fetchall()
+    group_names_list = await get_all_group_names()
 
-    if groups:
-        group_names_list = [group[0] for group in groups]
+    if group_names_list:
         if language == "arabic":
             group_names = "هذه هي المجموعات: " + "، ".join(group_names_list)
         else:
@@ -132,16 +123,11 @@ async def group_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"[DEBUG] Available groups: {group_names}")
         
         # Convert the group list into speech and send it
-        voice_message = await text_to_speech(group_names)
+        voice_message = await text_to_speech(group_names, language=language)
         await update.message.reply_voice(voice_message)
     else:
-        if language == "arabic":
-            msg = "لا توجد مجموعات في قاعدة البيانات."
-        else:
-            msg = "No groups found in the database."
         print("[DEBUG] No groups found in the database.")
-        voice_message = await text_to_speech(msg)
-        await update.message.reply_voice(voice_message)
+        await reply_prompt(update.message, "no_groups_in_database", language)
 
     context.user_data["awaiting_group_choice"] = True
 
@@ -152,31 +138,18 @@ async def check_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     # Get user's preferred language
-    language = get_user_language(user_id) or "english"
+    language = await get_user_language(user_id) or "english"
 
-    cursor.execute("SELECT role FROM users WHERE user_id = %s", (user_id,))
-    result = cursor.fetchone()
+    role = await get_user_role(user_id)
 
-    if not result or result[0] != 'blind':
-        if language == "arabic":
-            await update.message.reply_voice(await text_to_speech("هذا الأمر متاح فقط للمستخدمين المكفوفين."))
-        else:
-            await update.message.reply_voice(await text_to_speech("This command is only for blind users."))
+    if role != 'blind':
+        await reply_prompt(update.message, "blind_only_command", language)
         return
 
     # Get distinct groups user belongs to that have messages
-    cursor.execute('''
-        SELECT DISTINCT g.group_id, g.group_name
-        FROM groups g
-        JOIN user_groups ug ON g.group_id = ug.group_id
-        JOIN messages m ON m.group_id = g.group_id
-        WHERE ug.user_id = %s
-          AND m.message_text IS NOT NULL
-          AND TRIM(g.group_name) != ''
-          AND g.group_name != 'None'
-    ''', (user_id,))
-
-    groups = cursor.fetchall()
+    groups = await get_groups_with_messages(user_id)
+
+    context.user_data["awaiting_group_choice"] = True
 
     if groups:
         if language == "arabic":
@@ -187,16 +160,9 @@ async def check_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
             response = "You have new messages from these groups:\n"
             for _, group_name in groups:
                 response += f"- {group_name}\n"
+        await update.message.reply_voice(await text_to_speech(response, language=language))
     else:
-        if language == "arabic":
-            response = "ليس لديك رسائل جديدة.\nهل هناك مجموعة تريد إرسال رسالة إليها؟ فقط قل اسم المجموعة."
-        else:
-            response = "You have no new messages.\nIs there any group you want to send a message to? Just reply with the group name."
-
-    context.user_data["awaiting_group_choice"] = True
-
-    response_voice = await text_to_speech(response)
-    await update.message.reply_voice(response_voice)
+        await reply_prompt(update.message, "no_new_messages_any_group", language)
 
 
 
@@ -207,7 +173,7 @@ async def handle_settings_command(update: Update, context: ContextTypes.DEFAULT_
         return
     
     user_id = update.message.from_user.id
-    language = get_user_language(user_id)
+    language = await get_user_language(user_id)
 
     command_text = normalize_text(await speech_to_text(voice))
     print(f"[DEBUG] Voice command recognized: {command_text}")
@@ -216,13 +182,8 @@ async def handle_settings_command(update: Update, context: ContextTypes.DEFAULT_
     context.user_data["awaiting_language"] = True
     context.user_data["settings_mode"] = True
     
-    if language == "english":
-        msg = "Settings activated. Please say your preferred language: Arabic or English."
-        await update.message.reply_voice(await text_to_speech(msg))
-        return
-    elif language == "arabic":
-        msg = "الرجاء اختيار اللغة المفضّلة: العربية أو الانجليزية."
-        await update.message.reply_voice(await text_to_speech(msg))
+    if language in ("english", "arabic"):
+        await reply_prompt(update.message, "settings_activated", language)
         return
 
 
@@ -234,45 +195,20 @@ async def handle_help_command(update: Update, context:ContextTypes.DEFAULT_TYPE)
         return
     
     user_id = update.message.from_user.id
-    language = get_user_language(user_id)
-    role = get_user_role(user_id)
+    language = await get_user_language(user_id)
+    role = await get_user_role(user_id)
 
 
     if role!= "blind":
-        if language == "english":
-            for_sighted = "The help command is only available for blind users."
-            await update.message.reply_voice(await text_to_speech(for_sighted))
-        if language == "arabic":
-            for_sighted = f"اذا أردت التواصل مع شخص أعمى من خلالي، لطفًا زدني على مجموعة بينك وبينه،"\
-                f"وأنا سأتكفّل بتحويل رسائلك إلى تسجيلات صوتية وإرسالها له."\
-                f"غير هذه الخاصية، ليس عندي ميزات لك لأطلعك عليها. شكرًا على تعاونك!"
-            await update.message.reply_voice(await text_to_speech(for_sighted))
+        if language in ("english", "arabic"):
+            await reply_prompt(update.message, "help_for_sighted", language)
 
     
     command_text = normalize_text(await speech_to_text(voice))
     print(f"[DEBUG] Voice command recognized: {command_text}")
 
-    if language == "english":
-        confirmation = f"Here are the voice commands you can use any time:" \
-                    f"Say 'group' to hear all available groups." \
-                    f"Say 'check' to listen to your new messages." \
-                    f"Say 'switch to' followed by a group name to change groups." \
-                    f"Say 'help' to hear these instructions again." \
-                    f"Say 'settings' to change your language." \
-                    f"Just speak naturally. I’m always listening and ready to help."
-        
-    if language == "arabic":
-        confirmation = f"يمكنك استعمال هذه الكلمات المفتاحية:" \
-                    f"'group' لتعرف المجموعات التي دخلت فبها." \
-                    f"'check' لتسمع الرسائل الجديدة التي وصلتك." \
-                    f"'switch to' لتغيير المجموعة التي تود التحدث فيها، مع ذكر اسم المجموعة بعدها." \
-                    f"'help' لسماع هذه الارشادات مرة أخرى." \
-                    f"'settings'لتغيير اللغة  ." \
-                    f"تحدث كما تشاء، أنا هنا لأساعدك!"
-                
-    
-
-    await update.message.reply_voice(await text_to_speech(confirmation))
+    if language in ("english", "arabic"):
+        await reply_prompt(update.message, "help", language)
     return
 
 
@@ -285,11 +221,12 @@ async def addblind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.effective_chat.id
 
     # Save group info first (only once due to INSERT OR IGNORE)
-    save_group(group_id, group_name)
+    await save_group(group_id, group_name)
+    note_group_activity(group_id, group_name)
 
 
     # Check if sender role is sighted (only sighted can add blind users)
-    role = get_user_role(sender_id)
+    role = await get_user_role(sender_id)
     if role != "sighted":
         await update.message.reply_text("❌ Only sighted users can add blind users.")
         return
@@ -304,23 +241,24 @@ async def addblind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     for arg in context.args:
         blind_username = arg.lstrip("@")
-        blind_user_id = get_user_id_by_username(blind_username)
+        blind_user_id = await get_user_id_by_username(blind_username)
 
         if not blind_user_id:
             failed_users.append(f"@{blind_username} (not found)")
             continue
 
-        blind_user_role = get_user_role(blind_user_id)
+        blind_user_role = await get_user_role(blind_user_id)
         if blind_user_role != "blind":
             failed_users.append(f"@{blind_username} (not blind)")
             continue
 
-        if is_user_in_group(blind_user_id, group_id):
+        if await is_user_in_group(blind_user_id, group_id):
             failed_users.append(f"@{blind_username} (already in group)")
             continue
 
         # Add to group
-        add_user_to_group(blind_user_id, group_id)
+        await add_user_to_group(blind_user_id, group_id)
+        invalidate_group_index(blind_user_id)
         added_users.append(f"@{blind_username}")
 
     # Build reply message
@@ -1,12 +1,113 @@
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
-from config import BOT_TOKEN
+import asyncio
+import time
+from config import BOT_TOKEN, CONCURRENT_UPDATES, PRERENDER_PROMPTS, SWEEP_INTERVAL_SECONDS, SWEEP_BATCH_SIZE
+from config import PARTITION_MAINTENANCE_INTERVAL_SECONDS, STATE_UPDATE_INTERVAL, STATE_MAX_USERS, STATE_IDLE_SECONDS, MODEL_PRELOAD
+from config import CACHE_STATS_INTERVAL_SECONDS
 from handlers.onboarding_handlers import start
 from handlers.group_handlers import handle_group_message
 from handlers.command_handlers import voice_handler,addblind_command
-from services.image import handle_photo
+from services.image import handle_photo, shutdown_caption_executor, get_caption_cache_stats
+from services.stt_executor import shutdown_stt_executor
+from services.stt_service import get_transcript_cache_stats
+from services.tts_service import get_tts_cache_stats
+from services.group_index import get_group_index_stats
+from services.inference_workers import shutdown_inference_workers
+from services.prompt_library import render_all_prompts
+from services.model_registry import models
+from database.database_setup import open_pool, close_pool, setup_database
+from database.ingest_buffer import start_ingest_buffer, stop_ingest_buffer
+from database.database_functions import delete_fully_delivered_messages, maintain_message_partitions
+from database.user_cache import start_user_cache_listener, stop_user_cache_listener, get_user_cache_stats
+from database.persistence import PostgresPersistence
+from handlers.update_processor import PerChatUpdateProcessor
+
+
+# background tasks started with the bot (kept referenced so they aren't garbage collected)
+background_tasks = set()
+
+
+async def on_startup(app):
+    await open_pool()
+    await setup_database()  # Create tables and apply pending migrations
+    await maintain_message_partitions()  # partitions for this month and the next ones must exist before inserts
+    start_ingest_buffer()
+    start_user_cache_listener()  # profile changes made by other bot instances
+
+    if PRERENDER_PROMPTS:
+        # rendered in the background so polling starts right away
+        background_tasks.add(asyncio.create_task(render_all_prompts()))
+
+    if MODEL_PRELOAD:
+        background_tasks.add(asyncio.create_task(warm_up_models()))
+
+    print(f"✅ Bot started in {time.perf_counter() - models.started_at:.1f}s (models: {models.get_status()})")
+
+
+# one model at a time, so they don't compete for CPU/memory while loading
+async def warm_up_models():
+    for name in ("whisper", "blip"):
+        try:
+            await models.wait_until_ready(name)
+        except Exception:
+            pass  # already logged, loaded again on first use
+
+
+# JobQueue callback: deletes fully delivered messages the per-read cleanup missed, one bounded batch per run
+async def sweep_delivered_messages(context):
+    try:
+        deleted = await delete_fully_delivered_messages(limit=SWEEP_BATCH_SIZE)
+        if deleted:
+            print(f"[SWEEP] Deleted {deleted} fully delivered messages")
+    except Exception as e:
+        print(f"[ERROR] Delivered message sweep failed: {e}")
+
+
+# JobQueue callback: creates upcoming monthly message partitions and drops the expired ones
+async def maintain_partitions(context):
+    try:
+        dropped = await maintain_message_partitions()
+        if dropped:
+            print(f"[PARTITIONS] Dropped expired partitions: {', '.join(dropped)}")
+    except Exception as e:
+        print(f"[ERROR] Partition maintenance failed: {e}")
+
+
+# hit rates and sizes of the in-memory caches, to size them (*_CACHE_SIZE / *_TTL in config.py)
+def log_cache_stats():
+    for name, get_stats in [
+        ("transcripts", get_transcript_cache_stats),
+        ("tts", get_tts_cache_stats),
+        ("captions", get_caption_cache_stats),
+        ("users", get_user_cache_stats),
+        ("group indexes", get_group_index_stats),
+    ]:
+        stats = get_stats()
+        details = ", ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}" for key, value in stats.items())
+        print(f"[CACHE] {name}: {details}")
+
+
+# JobQueue callback
+async def report_cache_stats(context):
+    log_cache_stats()
+
+
+async def on_shutdown(app):
+    log_cache_stats()
+    shutdown_stt_executor()
+    shutdown_caption_executor()
+    shutdown_inference_workers()
+    stop_user_cache_listener()
+    await stop_ingest_buffer()  # buffered messages are written before the pool closes
+    await close_pool()
+
 
 def create_bot():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # concurrent updates let text messages be handled while voice notes are still being transcribed
+    # (in other chats: a chat's own updates are handled in order, see handlers/update_processor.py)
+    # conversation state survives restarts (see database/persistence.py)
+    persistence = PostgresPersistence(update_interval=STATE_UPDATE_INTERVAL, max_users=STATE_MAX_USERS, idle_seconds=STATE_IDLE_SECONDS)
+    app = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES)).persistence(persistence).post_init(on_startup).post_shutdown(on_shutdown).build()
     # Add command and callback handlers
      
     app.add_handler(CommandHandler("start", start))
@@ -14,5 +115,12 @@ def create_bot():
     app.add_handler(MessageHandler(filters.VOICE, voice_handler))
     app.add_handler(MessageHandler(filters.TEXT & filters.ChatType.GROUPS, handle_group_message))
     app.add_handler(MessageHandler(filters.PHOTO & filters.ChatType.GROUPS, handle_photo))
+
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(sweep_delivered_messages, interval=SWEEP_INTERVAL_SECONDS, first=SWEEP_INTERVAL_SECONDS)
+        app.job_queue.run_repeating(maintain_partitions, interval=PARTITION_MAINTENANCE_INTERVAL_SECONDS, first=PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+        app.job_queue.run_repeating(report_cache_stats, interval=CACHE_STATS_INTERVAL_SECONDS, first=CACHE_STATS_INTERVAL_SECONDS)
+    else:
+        print("⚠️ JobQueue not available (install python-telegram-bot[job-queue]), delivered message sweep, partition maintenance and cache stats disabled")
     return app
  
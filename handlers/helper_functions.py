@@ -2,7 +2,9 @@ from pydub import AudioSegment #library to concatenate audio files
 import io
 import string
 import os
-from rapidfuzz import process, fuzz
+import re
+import datetime
+from config import DIGEST_CHUNK_CHARS
 
 '''def merge_voice_bytes(v_en: bytes, v_ar: bytes, output_path="merged.mp3"):
     sound_en = AudioSegment.from_file(io.BytesIO(v_en), format="mp3")
@@ -15,20 +17,62 @@ from rapidfuzz import process, fuzz
     return output_path
 '''
 
+# when Telegram received the message, as naive UTC like the messages.created_at column
+def message_time(message):
+    return message.date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
 def normalize_text(normalized_text):
     # Convert to lowercase and strip both whitespace and punctuation
     return normalized_text.lower().strip().strip(string.punctuation)
 
 
-def fuzzy_language_match(text, options, threshold=70):
-    match = process.extractOne(text, options, scorer=fuzz.partial_ratio) #fuzz.partial_ratio looks for partial matches within the input text
-    if match and match[1] >= threshold:
-        print(f"Matched text: {match[0]}")
-        return match[0]
+# split a long text at sentence ends, then at spaces, so no piece is longer than max_chars
+def split_sentences(text, max_chars):
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?؟])\s+", text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+    return pieces
+
+
+# Builds the spoken digest of unseen messages.
+# If the previous sender is the same, merge their messages and only say the sender name once.
+# Returns the digest split into chunks of about max_chars (at sender/sentence boundaries) and the message ids.
+def build_digest_chunks(messages, max_chars=DIGEST_CHUNK_CHARS):
+    grouped = []
+    prev_sender = None
+    current_texts = []
+    message_ids = []
+
+    for sender_name, message_text, message_id in messages:
+        message_ids.append(message_id)
+        if sender_name == prev_sender:
+            current_texts.append(message_text)
+        else:
+            if prev_sender is not None:
+                grouped.append((prev_sender, current_texts))
+            prev_sender = sender_name
+            current_texts = [message_text]
+    if prev_sender is not None:
+        grouped.append((prev_sender, current_texts))
 
+    chunks = []
+    current = ""
+    for sender, texts in grouped:
+        merged_text = ", ".join(texts)
+        for piece in split_sentences(f"{sender} said {merged_text}.", max_chars):
+            if current and len(current) + len(piece) + 1 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
 
-def get_normalized_user_groups(user_groups):
-    return {
-        normalize_text(name): (group_id, name)
-        for group_id, name in user_groups
-    }
\ No newline at end of file
+    return chunks, message_ids
@@ -0,0 +1,89 @@
+import numpy as np
+from rapidfuzz import process, fuzz
+from handlers.helper_functions import normalize_text
+
+
+# Scores an utterance against every keyword of every intent in one rapidfuzz cdist call.
+# keywords: {intent: [phrases in any language]}, the order of the intents breaks ties.
+class IntentMatcher:
+    def __init__(self, keywords, threshold=70):
+        self.threshold = threshold
+        self.intents = list(keywords)
+        self.phrases = []
+        self.starts = []  # position of each intent's first phrase
+        for intent in self.intents:
+            self.starts.append(len(self.phrases))
+            self.phrases.extend(normalize_text(phrase) for phrase in keywords[intent])
+
+    # [(intent, confidence 0-1)] for the intents scoring at least the threshold, best first
+    def rank(self, text):
+        if not text:
+            return []
+        scores = process.cdist([text], self.phrases, scorer=fuzz.partial_ratio)[0]
+        best = np.maximum.reduceat(scores, self.starts)  # best phrase score of each intent
+        order = sorted(range(len(self.intents)), key=lambda i: -best[i])  # stable: table order on ties
+        return [(self.intents[i], best[i] / 100) for i in order if best[i] >= self.threshold]
+
+    # best intent or None
+    def match(self, text):
+        ranked = self.rank(text)
+        if ranked:
+            print(f"Matched intent: {ranked[0][0]} ({ranked[0][1]:.2f})")
+            return ranked[0][0]
+        return None
+
+
+# Voice commands of blind users in private chat (English & Arabic)
+voice_commands = IntentMatcher({
+    "check": ["check", "شيك", "تحقق", "/check"],
+    "help": ["help", "مساعدة"],
+    "switch": ["switch to", "انتقل الى", "حول الى", "انتقل إلى"],
+    "group": ["group", "/group", "مجموعة"],
+    "settings": ["settings", "اعدادات"],
+})
+
+yes_no = IntentMatcher({
+    "yes": ["yes", "اجل", "نعم"],
+    "no": ["no", "لا", "كلا"],
+})
+
+# values are users.language
+languages = IntentMatcher({
+    "arabic": ["arabic", "عربية", "أربك"],
+    "english": ["english", "انكليزية", "Inglisia"],
+})
+
+# values are users.role
+roles = IntentMatcher({
+    "blind": ["blind", "أعمى"],
+    "sighted": ["sighted", "بصير", "basir"],
+})
+
+
+# Microbenchmark: python -m handlers.intents
+# compares one compiled pass with the previous one-extractOne-per-keyword-list approach
+if __name__ == "__main__":
+    import timeit
+
+    utterances = ["check my messages", "انتقل الى العائلة", "switch to work", "help me", "اعدادات", "something else entirely"]
+    keyword_lists = [
+        ["check", "شيك", "تحقق", "/check"],
+        ["group", "/group", "مجموعة"],
+        ["switch to", "انتقل الى", "حول الى", "انتقل إلى"],
+        ["help", "مساعدة"],
+        ["settings", "اعدادات"],
+    ]
+
+    def per_list():
+        for text in utterances:
+            for options in keyword_lists:
+                process.extractOne(text, options, scorer=fuzz.partial_ratio, score_cutoff=70)
+
+    def compiled():
+        for text in utterances:
+            voice_commands.rank(text)
+
+    runs = 2000
+    for name, func in [("extractOne per list", per_list), ("compiled matcher", compiled)]:
+        seconds = timeit.timeit(func, number=runs)
+        print(f"{name}: {seconds / (runs * len(utterances)) * 1e6:.1f} us per utterance")
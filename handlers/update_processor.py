@@ -0,0 +1,34 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+
+# Updates of different chats are handled concurrently, updates of the same chat one after the other
+# in the order Telegram sent them, so a chat's messages are saved in order and one user's consecutive
+# voice notes don't race on their conversation state (user_data)
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, updates holding or waiting for it], dropped when the last one is done
+        self._chats = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:  # e.g. poll updates, nothing to keep in order
+            await coroutine
+            return
+
+        entry = self._chats.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:  # asyncio locks are fair, waiters run in arrival order
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,89 @@
+import re
+from rapidfuzz import process, fuzz
+from config import GROUP_INDEX_CACHE_SIZE, GROUP_INDEX_TTL
+from services.ttl_cache import TTLCache
+from handlers.helper_functions import normalize_text
+from database.database_functions import get_user_groups
+
+# Rough Arabic -> Latin transliteration, so a group named in one script can be matched
+# from a transcript in the other ("فاميلي" / "family")
+ARABIC_TO_LATIN = {
+    "ا": "a", "أ": "a", "إ": "i", "آ": "a", "ء": "", "ئ": "y", "ؤ": "w",
+    "ب": "b", "ت": "t", "ث": "th", "ج": "j", "ح": "h", "خ": "kh",
+    "د": "d", "ذ": "th", "ر": "r", "ز": "z", "س": "s", "ش": "sh",
+    "ص": "s", "ض": "d", "ط": "t", "ظ": "z", "ع": "a", "غ": "gh",
+    "ف": "f", "ق": "q", "ك": "k", "ل": "l", "م": "m", "ن": "n",
+    "ه": "h", "ة": "a", "و": "w", "ي": "y", "ى": "a",
+}
+ARABIC_MARKS = re.compile("[\u064b-\u0652\u0640]")  # harakat and tatweel
+
+
+def transliterate(text):
+    text = ARABIC_MARKS.sub("", text)
+    return "".join(ARABIC_TO_LATIN.get(char, char) for char in text)
+
+
+# The groups of one blind user, with every name in its normalized and transliterated form
+class GroupIndex:
+    def __init__(self, groups):
+        self.groups = list(groups)  # (group_id, group_name)
+        self.group_ids = {group_id for group_id, _ in self.groups}
+        self.choices = []
+        self.owners = []  # choice position -> position in self.groups
+
+        for position, (_, name) in enumerate(self.groups):
+            normalized = normalize_text(name or "")
+            for form in dict.fromkeys([normalized, transliterate(normalized)]):
+                if form:
+                    self.choices.append(form)
+                    self.owners.append(position)
+
+    # best (group_id, group_name) for a spoken group name, or None.
+    # The transcript and its transliteration are scored against every form in one cdist call.
+    def match(self, text, threshold=70):
+        if not self.choices:
+            return None
+
+        query = normalize_text(text)
+        scores = process.cdist([query, transliterate(query)], self.choices, scorer=fuzz.partial_ratio)
+        best = int(scores.argmax())
+        if scores.flat[best] < threshold:
+            return None
+
+        column = best % len(self.choices)
+        print(f"Matched group: {self.choices[column]}")
+        return self.groups[self.owners[column]]
+
+
+group_indexes = TTLCache(max_size=GROUP_INDEX_CACHE_SIZE, ttl_seconds=GROUP_INDEX_TTL)  # user_id -> GroupIndex
+indexed_group_names = {}  # group_id -> name the cached indexes were built with
+
+
+async def get_group_index(user_id):
+    index = group_indexes.get(user_id)
+    if index is None:
+        index = GroupIndex(await get_user_groups(user_id))
+        group_indexes.set(user_id, index)
+        indexed_group_names.update(index.groups)
+    return index
+
+
+def invalidate_group_index(user_id):
+    group_indexes.pop(user_id)
+
+
+# Called whenever a group is saved: a renamed group drops every cached index (renames are rare),
+# a member whose index doesn't have the group yet may just have joined it
+def note_group_activity(group_id, group_name, member_id=None):
+    if group_name is not None and indexed_group_names.get(group_id, group_name) != group_name:
+        group_indexes.clear()
+        indexed_group_names.clear()
+
+    if member_id is not None:
+        index = group_indexes.peek(member_id)
+        if index is not None and group_id not in index.group_ids:
+            invalidate_group_index(member_id)
+
+
+def get_group_index_stats():
+    return group_indexes.get_stats()
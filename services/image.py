@@ -1,38 +1,167 @@
-import os
+import asyncio
 import torch
+import numpy as np
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from telegram import Update
-from telegram.ext import ContextTypes 
-from database.database_functions import save_group, save_group_message
+from telegram.ext import ContextTypes
+from handlers.group_handlers import save_incoming_message
+from handlers.helper_functions import message_time
+from services.model_registry import models
+from services.micro_batcher import MicroBatcher
+from services.ttl_cache import TTLCache
+from services.inference_workers import InferenceWorkers
+from config import CAPTION_WORKERS, CAPTION_QUEUE_SIZE, CAPTION_BATCH_SIZE, CAPTION_BATCH_WINDOW_MS
+from config import CAPTION_CACHE_SIZE, CAPTION_CACHE_TTL, INFERENCE_MODE
 
+device = "cuda" if torch.cuda.is_available() else "cpu"
 
-import os
-import torch
-from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
-from telegram import Update
-from telegram.ext import ContextTypes 
-from database.database_functions import save_group, save_group_message
 
-# Load BLIP model once
-device = "cuda" if torch.cuda.is_available() else "cpu"
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base", use_fast=True)
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(device)
+# Load BLIP model once (through the model registry, on first use or by the startup warm-up)
+def load_blip():
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base", use_fast=True)
+    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(device)
+    return processor, model
+
+
+# runs in the caption worker: one generate call for the whole batch, returns one caption per image
+def caption_batch(images):
+    processor, model = models.get("blip")
+    inputs = processor(images=images, return_tensors="pt").to(device)
+    with torch.no_grad():
+        output = model.generate(**inputs)
+    return processor.batch_decode(output, skip_special_tokens=True)
+
+
+# runs in a caption worker process, images arrive as RGB pixel arrays in shared memory
+def caption_arrays(arrays):
+    return caption_batch([Image.fromarray(array) for array in arrays])
+
+
+# caption a blank image once so the first real photo doesn't pay the warm-up
+def warm_up_blip(arrays=()):
+    caption_batch([Image.new("RGB", (384, 384), "white")])
+
+
+# BLIP runs in its own worker threads (torch releases the GIL), never on the event loop
+caption_executor = ThreadPoolExecutor(max_workers=CAPTION_WORKERS, thread_name_prefix="caption")
+
+
+async def run_in_caption_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(caption_executor, func, *args)
+
+
+def shutdown_caption_executor():
+    caption_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# with INFERENCE_MODE=workers, BLIP runs in dedicated processes (started on first use),
+# each warms BLIP up when it starts and a replaced (crashed) pool is warmed up again before BLIP counts as ready
+caption_workers = InferenceWorkers("caption", CAPTION_WORKERS, initializer=warm_up_blip,
+                                   on_restart=lambda: models.restart_warm_up("blip"))
+
+
+# worker processes warm BLIP up in their initializer, so starting them is enough;
+# the caption threads share one model: warming it up once is enough
+async def warm_up_caption_workers(func, images=()):
+    if INFERENCE_MODE == "workers":
+        return await caption_workers.start()
+    return await run_in_caption_executor(func, images)
+
+
+models.register("blip", load_blip, warmup=warm_up_blip, run_in=warm_up_caption_workers)
+
+
+async def process_caption_batch(images):
+    if INFERENCE_MODE == "workers":
+        captions = await caption_workers.run(caption_arrays, [np.asarray(image) for image in images])
+    else:
+        captions = await run_in_caption_executor(caption_batch, images)
+    print(f"[CAPTION] Captioned batch of {len(images)} (metrics: {caption_batcher.get_metrics()})")
+    return captions
+
+
+caption_batcher = MicroBatcher(
+    "caption",
+    process_caption_batch,
+    max_batch_size=CAPTION_BATCH_SIZE,
+    window_ms=CAPTION_BATCH_WINDOW_MS,
+    max_in_flight=CAPTION_WORKERS,
+    max_queue=CAPTION_QUEUE_SIZE,
+)
+
+
+def get_caption_metrics():
+    return caption_batcher.get_metrics()
+
+
+# BLIP resizes every image to 384x384
+CAPTION_INPUT_SIZE = 384
+
+
+# Telegram sends each photo in several sizes (smallest first): take the smallest one
+# that still covers the model input, so we don't download and decode pixels BLIP throws away
+def choose_photo_size(photo_sizes):
+    for size in photo_sizes:
+        if min(size.width, size.height) >= CAPTION_INPUT_SIZE:
+            return size
+    return photo_sizes[-1]
+
+
+# decodes in memory, draft mode lets the JPEG decoder downscale while decoding
+def open_image(data):
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (CAPTION_INPUT_SIZE, CAPTION_INPUT_SIZE))
+    return image.convert("RGB")
+
+
+# Captions by the photo's file_unique_id, so forwarded/re-posted photos are captioned once
+caption_cache = TTLCache(CAPTION_CACHE_SIZE, CAPTION_CACHE_TTL)
+# Captions currently being generated, so the same photo posted in several groups at once shares one result
+pending_captions = {}
+
+
+def get_caption_cache_stats():
+    return caption_cache.get_stats()
+
+
+async def caption_photo(photo_size):
+    file = await photo_size.get_file()
+    data = await file.download_as_bytearray()
+    image = await asyncio.to_thread(open_image, bytes(data))
+    return await caption_batcher.submit(image)  # batched with other photos being captioned
+
+
+async def get_caption(photo_size):
+    key = photo_size.file_unique_id
+    caption = caption_cache.get(key)
+    if caption is not None:
+        return caption
+
+    if key in pending_captions:
+        return await asyncio.shield(pending_captions[key])
+
+    # waits for the model if it is still loading
+    await models.wait_until_ready("blip")
+    pending_captions[key] = asyncio.ensure_future(caption_photo(photo_size))
+    try:
+        caption = await asyncio.shield(pending_captions[key])
+    finally:
+        pending_captions.pop(key, None)
+
+    caption_cache.set(key, caption)
+    return caption
+
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         #await update.message.reply_text("⏳ Processing image, please wait...")
 
-        photo_file = await update.message.photo[-1].get_file()
-        image_path = f"{update.message.message_id}_image.jpg"
-        await photo_file.download_to_drive(image_path)
-
         # Generate caption
-        image = Image.open(image_path).convert("RGB")
-        inputs = processor(image, return_tensors="pt").to(device)
-        output = model.generate(**inputs)
-        caption = processor.decode(output[0], skip_special_tokens=True)
+        caption = await get_caption(choose_photo_size(update.message.photo))
         await update.message.reply_text(f"🖼 Caption: {caption}")
 
         # Save to DB
@@ -41,17 +170,9 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         sender = update.message.from_user
         sender_name = sender.full_name
         image_caption = f"sent an image containing {caption}"
-        save_group(group_id, group_name)
-        save_group_message(group_id, group_name, sender.id, sender_name, image_caption)
+        await save_incoming_message(group_id, group_name, sender.id, sender_name, image_caption, message_time(update.message))
         print(f"[SAVED] From {sender_name} in Group {group_name}:{sender_name} sent an image contaning {caption}")
 
     except Exception as e:
         await update.message.reply_text("⚠️ Sorry, something went wrong processing the image.")
         print(f"[ERROR] {e}")
-
-    finally:
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        #if os.path.exists(voice_path):
-            #os.remove(voice_path)
-
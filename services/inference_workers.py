@@ -0,0 +1,169 @@
+import asyncio
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+
+# Dedicated worker processes for model inference (INFERENCE_MODE=workers), so Whisper/BLIP never share
+# the GIL with the polling loop. Jobs go to the workers over the pool's local pipes, but the numpy arrays
+# they work on (audio samples, image pixels) are copied once into a shared memory block instead of
+# being pickled through the pipe. A crashed worker breaks the pool: it is replaced and the job retried once.
+
+# --- shared memory hand-off ---
+
+# copies the arrays into one new shared memory block, returns it and where each array is
+def to_shared_memory(arrays):
+    shm = shared_memory.SharedMemory(create=True, size=max(sum(array.nbytes for array in arrays), 1))
+    descriptors = []
+    offset = 0
+    for array in arrays:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)[...] = array
+        descriptors.append((offset, array.shape, array.dtype.str))
+        offset += array.nbytes
+    return shm, descriptors
+
+
+# runs in a worker: func(arrays, *args) on views of the shared arrays (no copy)
+def run_shared_job(func, shm_name, descriptors, *args):
+    # workers share the bot process's resource tracker, the block is unlinked by the bot process
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = [
+        np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for offset, shape, dtype in descriptors
+    ]
+    try:
+        return func(arrays, *args)
+    finally:
+        del arrays
+        try:
+            shm.close()
+        except BufferError:
+            pass  # a view is still referenced somewhere, the mapping is released with it
+
+
+# a job that does nothing: the worker running it has already run the initializer
+def start_worker(arrays):
+    import os
+    return os.getpid()
+
+
+# --- worker pools ---
+
+all_workers = []
+
+
+# initializer() runs in every worker process when it starts, before it takes any job (e.g. loading the model).
+# on_restart() is called in the bot process when a crashed pool has been replaced.
+class InferenceWorkers:
+    def __init__(self, name, workers=1, initializer=None, on_restart=None):
+        self.name = name
+        self.workers = workers
+        self.initializer = initializer
+        self.on_restart = on_restart
+        self._pool = None
+        self.jobs = 0
+        self.restarts = 0
+        all_workers.append(self)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: fresh interpreters, no inherited event loop, threads or CUDA state
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+            )
+            print(f"[WORKERS] Started {self.workers} {self.name} worker processes")
+        return self._pool
+
+    def _restart(self, broken_pool):
+        if self._pool is broken_pool:  # concurrent jobs see the same crash, restart once
+            self._pool = None
+            self.restarts += 1
+            broken_pool.shutdown(wait=False, cancel_futures=True)
+            print(f"[WORKERS] A {self.name} worker died, restarting the pool (restart #{self.restarts})")
+            if self.on_restart is not None:
+                self.on_restart()
+
+    # func(arrays, *args) in a worker process, func must be a module-level function
+    async def run(self, func, arrays=(), *args):
+        shm, descriptors = to_shared_memory(arrays)
+        loop = asyncio.get_running_loop()
+        try:
+            for attempt in range(2):
+                pool = self._get_pool()
+                try:
+                    result = await loop.run_in_executor(pool, run_shared_job, func, shm.name, descriptors, *args)
+                    self.jobs += 1
+                    return result
+                except BrokenProcessPool:
+                    self._restart(pool)
+                    if attempt:
+                        raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # func(arrays, *args) once per worker. Submitted together, the jobs make the pool start all its
+    # processes (it only starts one when a job finds no idle worker), and each process runs the
+    # initializer before taking a job
+    async def run_on_every_worker(self, func, arrays=(), *args):
+        return await asyncio.gather(*(self.run(func, arrays, *args) for _ in range(self.workers)))
+
+    # starts every worker process now, each warmed up by the initializer alone; returns their pids
+    async def start(self):
+        return await self.run_on_every_worker(start_worker)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self):
+        return {"name": self.name, "workers": self.workers, "jobs": self.jobs, "restarts": self.restarts}
+
+
+def shutdown_inference_workers():
+    for workers in all_workers:
+        workers.shutdown()
+
+
+# Self-check on one machine: python -m services.inference_workers
+# starts every worker (each runs the initializer), sums arrays in a worker,
+# kills it mid-job and shows the job finishing on a restarted pool
+def _announce_worker():
+    import os
+    print(f"  worker {os.getpid()} initialized")
+
+
+def _sum_arrays(arrays):
+    return [float(array.sum()) for array in arrays]
+
+
+def _crash_once(arrays, marker):
+    import os
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return _sum_arrays(arrays)
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    async def main():
+        workers = InferenceWorkers("check", workers=2, initializer=_announce_worker,
+                                   on_restart=lambda: print("  on_restart called"))
+        print("workers:", sorted(set(await workers.start())))
+        arrays = [np.ones(16000 * 30, dtype=np.float32), np.full((384, 384, 3), 2, dtype=np.uint8)]
+        print("sums:", await workers.run(_sum_arrays, arrays))
+
+        marker = os.path.join(tempfile.mkdtemp(), "crashed")
+        print("after crash:", await workers.run(_crash_once, arrays, marker))
+        print("stats:", workers.get_stats())
+        workers.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+from functools import lru_cache
+from langdetect import DetectorFactory, detect
+
+# make langdetect deterministic (it is only used as a fallback)
+DetectorFactory.seed = 0
+
+ARABIC_RANGES = [
+    (0x0600, 0x06FF),  # Arabic
+    (0x0750, 0x077F),  # Arabic Supplement
+    (0x08A0, 0x08FF),  # Arabic Extended-A
+    (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
+    (0xFE70, 0xFEFF),  # Arabic Presentation Forms-B
+]
+
+# users.language values and Whisper/gTTS codes -> gTTS language code
+LANGUAGE_CODES = {"arabic": "ar", "english": "en", "ar": "ar", "en": "en"}
+
+
+def to_language_code(language):
+    if not language:
+        return None
+    return LANGUAGE_CODES.get(language.lower())
+
+
+def is_arabic(char):
+    code = ord(char)
+    return any(start <= code <= end for start, end in ARABIC_RANGES)
+
+
+def is_latin(char):
+    return char.isalpha() and ord(char) < 0x0250  # Basic Latin up to Latin Extended-B
+
+
+@lru_cache(maxsize=1024)
+def detect_with_langdetect(text):
+    try:
+        return detect(text)
+    except Exception:
+        return "ar"
+
+
+# Our users only speak Arabic and English, so counting Arabic vs Latin letters is enough.
+# A known language (users.language or the language Whisper detected) can be passed as a hint.
+def detect_language(text, hint=None):
+    code = to_language_code(hint)
+    if code:
+        return code
+
+    arabic = latin = 0
+    for char in text:
+        if is_arabic(char):
+            arabic += 1
+        elif is_latin(char):
+            latin += 1
+
+    if arabic or latin:
+        return "ar" if arabic >= latin else "en"
+
+    # no letters at all (numbers, emoji...)
+    return detect_with_langdetect(text)
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+
+# Collects requests for a short window (or until the batch is full) and processes them together.
+# process_batch is an async function that takes a list of items and returns one result per item.
+class MicroBatcher:
+    def __init__(self, name, process_batch, max_batch_size=8, window_ms=50, max_in_flight=1, max_queue=0):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.window_ms = window_ms
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+
+        self._queue = None
+        self._slots = None
+        self._task = None
+
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+        self.total_latency = 0.0  # seconds from submit to result, summed over all items
+
+    async def submit(self, item):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+
+            # wait up to window_ms for more requests
+            deadline = loop.time() + self.window_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+
+            # requests that arrived while waiting for a free slot join this batch
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        try:
+            results = await self.process_batch([item for item, _, _ in batch])
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ERROR] {self.name} batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        self.last_batch_size = len(batch)
+        self.largest_batch_size = max(self.largest_batch_size, len(batch))
+        self.total_latency += sum(now - submitted for _, _, submitted in batch)
+
+    def get_metrics(self):
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window_ms,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "last_batch_size": self.last_batch_size,
+            "largest_batch_size": self.largest_batch_size,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "avg_latency_ms": 1000 * self.total_latency / self.items if self.items else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
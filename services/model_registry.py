@@ -0,0 +1,105 @@
+import time
+import asyncio
+import threading
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+# Heavy models (Whisper, BLIP) are registered here instead of being loaded at import, so polling starts right away.
+# A model is loaded by get() on first use, and warmed up (loaded + one synthetic inference) in the background
+# by start_warm_up(). Handlers check is_ready()/ensure_ready() to answer "please wait" until the warm-up is done.
+class ModelRegistry:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._models = {}
+
+    # loader() returns the model; warmup() loads it through get() and runs a synthetic inference
+    # run_in(func) runs warmup off the event loop (default: a thread), e.g. in every worker of the pool that uses the model
+    def register(self, name, loader, warmup=None, run_in=None):
+        self._models[name] = {
+            "loader": loader,
+            "warmup": warmup,
+            "run_in": run_in,
+            "model": None,
+            "lock": threading.Lock(),
+            "state": NOT_LOADED,
+            "task": None,
+            "ready_seconds": None,
+        }
+
+    # blocking, call it from a worker thread/process
+    def get(self, name):
+        entry = self._models[name]
+        if entry["model"] is None:
+            with entry["lock"]:
+                if entry["model"] is None:
+                    start = time.perf_counter()
+                    entry["model"] = entry["loader"]()
+                    print(f"[MODELS] Loaded {name} in {time.perf_counter() - start:.1f}s")
+        return entry["model"]
+
+    def state(self, name):
+        return self._models[name]["state"]
+
+    def is_ready(self, name):
+        return self.state(name) == READY
+
+    # starts the background warm-up once (again after a failure), returns its task
+    def start_warm_up(self, name):
+        entry = self._models[name]
+        if entry["task"] is None:
+            entry["task"] = asyncio.create_task(self._warm_up(name))
+        return entry["task"]
+
+    async def _warm_up(self, name):
+        entry = self._models[name]
+        entry["state"] = LOADING
+        start = time.perf_counter()
+        run_in = entry["run_in"] or asyncio.to_thread
+        try:
+            await run_in(entry["warmup"] or (lambda: self.get(name)))
+        except Exception as e:
+            entry["state"] = FAILED
+            entry["task"] = None
+            print(f"[ERROR] Failed to load model {name}: {e}")
+            return
+
+        entry["state"] = READY
+        entry["ready_seconds"] = time.perf_counter() - self.started_at
+        print(f"[MODELS] {name} ready: warm-up took {time.perf_counter() - start:.1f}s, "
+              f"{entry['ready_seconds']:.1f}s after start")
+
+    # the workers holding the model were replaced (e.g. after a crash): warm the new ones up again
+    # (a warm-up still running retries on the new workers by itself)
+    def restart_warm_up(self, name):
+        entry = self._models[name]
+        if entry["state"] == READY:
+            entry["state"] = NOT_LOADED
+            entry["task"] = None
+            self.start_warm_up(name)
+
+    # True if the model can be used now, otherwise makes sure it is being loaded
+    def ensure_ready(self, name):
+        if self.is_ready(name):
+            return True
+        self.start_warm_up(name)
+        return False
+
+    # waits (without blocking the event loop) until the model is ready
+    async def wait_until_ready(self, name):
+        if not self.is_ready(name):
+            await asyncio.shield(self.start_warm_up(name))
+        if not self.is_ready(name):
+            raise RuntimeError(f"Model {name} failed to load")
+
+    def get_status(self):
+        return {
+            name: {"state": entry["state"], "ready_seconds": entry["ready_seconds"]}
+            for name, entry in self._models.items()
+        }
+
+
+models = ModelRegistry()
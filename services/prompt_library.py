@@ -0,0 +1,248 @@
+from io import BytesIO
+from telegram.error import BadRequest
+from services.tts_service import text_to_speech_with_status, merge_texts_to_speech_with_status
+
+
+# Fixed replies, rendered once and then re-sent by their Telegram file_id
+PROMPTS = {
+    # --- group handlers ---
+    "no_voice_received": {
+        "english": "I didn't receive any voice. Please try again.",
+        "arabic": "لم أستلم أي رسالة صوتية. حاول مرة أخرى.",
+    },
+    "voice_processing_error": {
+        "english": "There was an error processing your voice. Please try again.",
+        "arabic": "حدث خطأ أثناء معالجة صوتك. حاول مرة أخرى.",
+    },
+    "voice_not_understood": {
+        "english": "Sorry, I couldn't understand your voice. Try again.",
+        "arabic": "عذرًا، لم أتمكن من فهم صوتك. حاول مرة أخرى.",
+    },
+    "group_not_found": {
+        "english": "This group is not found. Try again.",
+        "arabic": "لم أجد هذه المجموعة. حاول مرة أخرى.",
+    },
+    "no_new_messages_send_one": {
+        "english": "No new messages. Do you want to send one say yes or no?",
+        "arabic": "لا توجد رسائل جديدة. هل تريد إرسال رسالة قل نعم أو لا ؟",
+    },
+    "send_voice_message": {
+        "english": "Please send a voice message.",
+        "arabic": "يرجى إرسال رسالة صوتية.",
+    },
+    "no_reply_needed": {
+        "english": "Okay, no reply needed.",
+        "arabic": "حسنًا، لا حاجة للرد.",
+    },
+    "say_yes_or_no": {
+        "english": "I didn't understand. Please say yes or no.",
+        "arabic": "لم أفهم. الرجاء قول نعم أو لا.",
+    },
+    "response_error": {
+        "english": "There was an error understanding you. Try again.",
+        "arabic": "حدث خطأ أثناء الفهم. حاول مرة أخرى.",
+    },
+    "not_expecting_voice": {
+        "english": "I wasn’t expecting a voice message now. Please select a group first.",
+        "arabic": "لم أكن أتوقع رسالة صوتية الآن. يرجى اختيار مجموعة أولاً.",
+    },
+    "no_group_selected": {
+        "english": "You haven’t selected a group to send your message to.",
+        "arabic": "لم تقم باختيار مجموعة لإرسال رسالتك إليها.",
+    },
+    "reply_group_not_found": {
+        "english": "I couldn’t find the group to send your message.",
+        "arabic": "لم أتمكن من العثور على المجموعة لإرسال رسالتك.",
+    },
+    "no_voice_to_send": {
+        "english": "I didn’t receive a voice message to send.",
+        "arabic": "لم أستلم أي رسالة صوتية لإرسالها.",
+    },
+    "message_sent": {
+        "english": "Your message has been sent. You can record another",
+        "arabic": " تم إرسال رسالتك. يمكنك تسجيل أخرى ",
+    },
+    "message_send_failed": {
+        "english": "Something went wrong while sending your message.",
+        "arabic": "حدث خطأ أثناء إرسال رسالتك.",
+    },
+
+    # --- command handlers ---
+    "unexpected_input": {
+        "english": "Unexpected Input. Please use a command or follow the instructions.",
+    },
+    "voice_problem": {
+        "english": "There was a problem understanding your voice. Try again.",
+    },
+    "model_loading": {
+        "english": "I'm still getting ready. Please try again in a moment.",
+        "arabic": "ما زلت أستعد. الرجاء المحاولة مرة أخرى بعد لحظات.",
+    },
+    "no_groups_in_database": {
+        "english": "No groups found in the database.",
+        "arabic": "لا توجد مجموعات في قاعدة البيانات.",
+    },
+    "blind_only_command": {
+        "english": "This command is only for blind users.",
+        "arabic": "هذا الأمر متاح فقط للمستخدمين المكفوفين.",
+    },
+    "no_new_messages_any_group": {
+        "english": "You have no new messages.\nIs there any group you want to send a message to? Just reply with the group name.",
+        "arabic": "ليس لديك رسائل جديدة.\nهل هناك مجموعة تريد إرسال رسالة إليها؟ فقط قل اسم المجموعة.",
+    },
+    "settings_activated": {
+        "english": "Settings activated. Please say your preferred language: Arabic or English.",
+        "arabic": "الرجاء اختيار اللغة المفضّلة: العربية أو الانجليزية.",
+    },
+    "help_for_sighted": {
+        "english": "The help command is only available for blind users.",
+        "arabic": "اذا أردت التواصل مع شخص أعمى من خلالي، لطفًا زدني على مجموعة بينك وبينه،"
+                  "وأنا سأتكفّل بتحويل رسائلك إلى تسجيلات صوتية وإرسالها له."
+                  "غير هذه الخاصية، ليس عندي ميزات لك لأطلعك عليها. شكرًا على تعاونك!",
+    },
+    "help": {
+        "english": "Here are the voice commands you can use any time:"
+                   "Say 'group' to hear all available groups."
+                   "Say 'check' to listen to your new messages."
+                   "Say 'switch to' followed by a group name to change groups."
+                   "Say 'help' to hear these instructions again."
+                   "Say 'settings' to change your language."
+                   "Just speak naturally. I’m always listening and ready to help.",
+        "arabic": "يمكنك استعمال هذه الكلمات المفتاحية:"
+                  "'group' لتعرف المجموعات التي دخلت فبها."
+                  "'check' لتسمع الرسائل الجديدة التي وصلتك."
+                  "'switch to' لتغيير المجموعة التي تود التحدث فيها، مع ذكر اسم المجموعة بعدها."
+                  "'help' لسماع هذه الارشادات مرة أخرى."
+                  "'settings'لتغيير اللغة  ."
+                  "تحدث كما تشاء، أنا هنا لأساعدك!",
+    },
+
+    # --- onboarding handlers ---
+    "already_started": {
+        "english": "You already clicked start and set the language, you can say 'settings' to change it",
+        "arabic": "لقد حدّدت اللغة مسبقًا، لتغييرها يمكنك قول settings",
+    },
+    "language_updated": {
+        "english": "Your language has been updated successfully.",
+        "arabic": "تم تحديث لغتك بنجاح.",
+    },
+    "ask_role": {
+        "english": "Thank you. Now please say if you are blind or sighted.",
+        "arabic": "شكرًا لكم. الرجاء تحديد الصفة، اذا كنت أعمى أو بصير",
+    },
+    "role_already_set": {
+        "english": "You have already clicked start and set the role, you can say 'settings' to change it",
+        "arabic": "لقد تمّ تحديد الصفة سابقًا من قبلك. لتغييرها، قل setting ",
+    },
+    "role_not_understood": {
+        "english": "I didn't understand. Please say 'blind' or 'sighted'.",
+        "arabic": "لم أفهم، الرجاء قول أعمى أو بصير",
+    },
+    "role_set_blind": {
+        "english": "Your role is set to Blind and language to English.\n"
+                   "Here are the voice commands you can use:\n"
+                   "- 'group' to hear available groups\n"
+                   "- 'check' to listen to your new messages\n"
+                   "- 'switch to' + group name to change groups\n"
+                   "- 'help' to hear these instructions again\n"
+                   "- 'settings' to change your language.\n"
+                   "Speak naturally. I’m listening!",
+        "arabic": "يمكنك استعمال هذه الكلمات المفتاحية:\n"
+                  "- 'group' لتعرف المجموعات التي دخلت فيها\n"
+                  "- 'check' لتسمع الرسائل الجديدة\n"
+                  "- 'switch to' لتغيير المجموعة\n"
+                  "- 'help' لسماع هذه الإرشادات\n"
+                  "- 'settings' لتغيير اللغة\n"
+                  "تحدث كما تشاء، أنا هنا لأساعدك!",
+    },
+    "role_set_sighted": {
+        "english": "Your role is set to Sighted and language to English.\n"
+                   "If you want to communicate with a blind user, add me to a group with them.\n"
+                   "Then, send a message and type the command:\n"
+                   "/addblind @username for each blind user in the group.\n"
+                   "I will convert your messages to voice and deliver them.\n"
+                   "Otherwise, I have no features to offer.\n"
+                   "Thanks for trying me!",
+        "arabic": "اذا أردت التواصل مع شخص أعمى من خلالي، زدني على مجموعة بينكما.\n"
+                  "سأتكفّل بتحويل رسائلك إلى تسجيلات صوتية.\n"
+                  "ثم أرسل رسالة في المجموعة واكتب الأمر:\n"
+                  "/addblind @username لكل مستخدم أعمى موجود في المجموعة.\n"
+                  "غير ذلك، لا أملك ميزات مخصصة لك.\n"
+                  "شكرًا لتعاونك!",
+    },
+}
+
+# Prompts spoken in both languages, one after the other
+MERGED_PROMPTS = {
+    "welcome": (
+        "Welcome to HearMe! Please specify your preferred language: Arabic or English.",
+        "أهلًا بكم! الرجاء اختيار اللغة المفضّلة لديكم: العربية أو الانجليزية",
+    ),
+    "language_not_understood": (
+        "I didn't understand. Please say Arabic or English.",
+        "لم أفهم، الرجاء قول عربية أو انجليزية ",
+    ),
+}
+
+# (key, language) -> rendered audio bytes
+prompt_audio = {}
+# (key, language) -> Telegram file_id returned by the first upload
+prompt_file_ids = {}
+
+
+def prompt_language(key, language):
+    if key in MERGED_PROMPTS:
+        return "both"
+    # like the original replies: English only for English speakers, Arabic otherwise (also for unknown or unset languages)
+    if language == "english" or "arabic" not in PROMPTS[key]:
+        return "english"
+    return "arabic"
+
+
+async def render_prompt(key, language=None):
+    language = prompt_language(key, language)
+    if (key, language) in prompt_audio:
+        return prompt_audio[(key, language)]
+
+    if language == "both":
+        audio, succeeded = await merge_texts_to_speech_with_status(*MERGED_PROMPTS[key])
+    else:
+        audio, succeeded = await text_to_speech_with_status(PROMPTS[key][language], language=language)
+
+    # the spoken error message is sent this time but never kept, the prompt is rendered again on next use
+    if succeeded:
+        prompt_audio[(key, language)] = audio.getvalue()
+    else:
+        print(f"[ERROR] Prompt {key} could not be synthesized, not caching it")
+    return audio.getvalue()
+
+
+# render every static prompt ahead of time (run in the background at startup)
+async def render_all_prompts():
+    to_render = [(key, language) for key, texts in PROMPTS.items() for language in texts]
+    to_render += [(key, None) for key in MERGED_PROMPTS]
+
+    for key, language in to_render:
+        try:
+            await render_prompt(key, language)
+        except Exception as e:
+            print(f"[ERROR] Failed to render prompt {key}: {e}")
+    print(f"[PROMPTS] Rendered {len(prompt_audio)} prompts")
+
+
+async def reply_prompt(message, key, language=None):
+    cache_key = (key, prompt_language(key, language))
+
+    file_id = prompt_file_ids.get(cache_key)
+    if file_id:
+        try:
+            return await message.reply_voice(file_id)
+        except BadRequest as e:
+            print(f"[ERROR] Cached prompt file_id rejected, uploading again: {e}")
+            prompt_file_ids.pop(cache_key, None)
+
+    audio = await render_prompt(key, language)
+    sent = await message.reply_voice(BytesIO(audio))
+    if sent and sent.voice and cache_key in prompt_audio:  # not the error message
+        prompt_file_ids[cache_key] = sent.voice.file_id
+    return sent
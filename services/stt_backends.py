@@ -0,0 +1,137 @@
+# every backend takes 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
+N_SAMPLES = 30 * SAMPLE_RATE  # Whisper's window
+
+
+# A speech recognition engine. load() returns the model (called once per worker through the model registry),
+# transcribe_batch(model, audios) returns one (text, detected language code) per clip.
+# thread_safe: one loaded model can decode in several threads at once.
+# beam_size is the same for every backend: 1 decodes greedily, more runs a beam search of that width
+class STTBackend:
+    name = None
+    thread_safe = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def transcribe_batch(self, model, audios):
+        raise NotImplementedError
+
+
+# openai-whisper on PyTorch (imported on load, so the other backends don't need torch). Not thread safe: decoding installs KV-cache hooks on the model's decoder modules
+class OpenAIWhisperBackend(STTBackend):
+    name = "whisper"
+
+    def __init__(self, model_name="small", beam_size=1):
+        self.model_name = model_name
+        self.beam_size = beam_size
+
+    def load(self):
+        import whisper
+        return whisper.load_model(self.model_name)
+
+    # clips up to 30 seconds are padded into one log-mel batch and decoded together,
+    # longer clips fall back to the regular sliding-window transcribe
+    def transcribe_batch(self, model, audios):
+        import torch
+        import whisper
+        results = [None] * len(audios)
+        beam_size = self.beam_size if self.beam_size > 1 else None  # None: greedy
+
+
+        short = [i for i, audio in enumerate(audios) if len(audio) <= N_SAMPLES]
+        for i, audio in enumerate(audios):
+            if i not in short:
+                result = model.transcribe(audio, beam_size=beam_size)
+                results[i] = (result["text"], result.get("language"))
+
+        if short:
+            mels = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(audios[i]), model.dims.n_mels)
+                for i in short
+            ]).to(model.device)
+            options = whisper.DecodingOptions(beam_size=beam_size, fp16=model.device.type == "cuda")
+            for i, result in zip(short, whisper.decode(model, mels, options)):
+                results[i] = (result.text, result.language)
+
+        return results
+
+
+# faster-whisper (CTranslate2), quantized weights e.g. int8 on CPU: same Whisper models, less memory and faster on CPU
+class FasterWhisperBackend(STTBackend):
+    name = "faster-whisper"
+    thread_safe = True  # CTranslate2 models accept concurrent calls
+
+    def __init__(self, model_name="small", compute_type="int8", device="auto", beam_size=1):
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.device = device
+        self.beam_size = beam_size
+
+    def load(self):
+        from faster_whisper import WhisperModel
+        return WhisperModel(self.model_name, device=self.device, compute_type=self.compute_type)
+
+    def transcribe_batch(self, model, audios):
+        results = []
+        for audio in audios:
+            segments, info = model.transcribe(audio, beam_size=self.beam_size)
+            text = "".join(segment.text for segment in segments)  # segments are generated lazily
+            results.append((text, info.language))
+        return results
+
+
+def create_stt_backend(name, model_name="small", compute_type="int8", beam_size=1):
+    if name == "whisper":
+        return OpenAIWhisperBackend(model_name, beam_size=beam_size)
+    if name == "faster-whisper":
+        return FasterWhisperBackend(model_name, compute_type=compute_type, beam_size=beam_size)
+    raise ValueError(f"Unknown STT backend: {name}")
+
+
+# Benchmark: python -m services.stt_backends <backend> <compute_type> clip1.ogg [clip2.ogg ...]
+# run it once per backend (a fresh process each, so the memory numbers don't mix) on the same clips, both decode with STT_BEAM_SIZE
+if __name__ == "__main__":
+    import sys
+    import time
+    import resource
+    import subprocess
+    import numpy as np
+    from config import STT_BEAM_SIZE
+
+    backend_name, compute_type, paths = sys.argv[1], sys.argv[2], sys.argv[3:]
+    backend = create_stt_backend(backend_name, compute_type=compute_type, beam_size=STT_BEAM_SIZE)
+
+    # same decoding as the bot (services/stt_service.py decode_audio), without openai-whisper
+    def load_clip(path):
+        pcm = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+             "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            capture_output=True, check=True,
+        ).stdout
+        return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+    clips = [load_clip(path) for path in paths]
+
+    def peak_rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    model = backend.load()
+    print(f"{backend_name} ({compute_type}): loaded in {time.perf_counter() - start:.1f}s, "
+          f"+{peak_rss_mb() - before:.0f} MB peak RSS")
+
+    backend.transcribe_batch(model, [clips[0][:SAMPLE_RATE]])  # warm-up
+
+    total_audio = total_time = 0.0
+    for path, clip in zip(paths, clips):
+        start = time.perf_counter()
+        [(text, language)] = backend.transcribe_batch(model, [clip])
+        elapsed = time.perf_counter() - start
+        duration = len(clip) / SAMPLE_RATE
+        total_audio += duration
+        total_time += elapsed
+        print(f"  {path}: {duration:.1f}s audio, RTF {elapsed / duration:.3f} [{language}] {text.strip()[:60]}")
+
+    print(f"overall RTF {total_time / total_audio:.3f}, peak RSS {peak_rss_mb():.0f} MB")
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import STT_WORKERS, STT_QUEUE_SIZE
+
+# Thread pool shared by every transcription with STT_EXECUTOR=thread (created on first use);
+# process mode runs in the restartable worker processes of services/inference_workers.py instead
+_executor = None
+# Limits how many transcriptions can be running or waiting at once
+_slots = None
+
+
+def get_stt_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=STT_WORKERS, thread_name_prefix="stt")
+        print(f"[STT] Started thread pool with {STT_WORKERS} workers")
+    return _executor
+
+
+# run a blocking STT function in the worker pool without blocking the event loop
+# when the queue is full, callers wait here until a slot frees up
+async def run_in_stt_executor(func, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(STT_WORKERS + STT_QUEUE_SIZE)
+
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_stt_executor(), func, *args)
+
+
+def shutdown_stt_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# Benchmark: python -m services.stt_executor clip1.ogg [clip2.ogg ...]
+# latency of text updates (a handler scheduled every 10 ms) while the clips are transcribed,
+# with Whisper called on the event loop (as before the executor) and off it (STT_EXECUTOR / INFERENCE_MODE)
+if __name__ == "__main__":
+    import sys
+    import time
+    from config import STT_EXECUTOR
+    from services.stt_service import decode_audio, transcribe_batch, warm_up_whisper, warm_up_stt_workers, run_stt_job
+    from services.inference_workers import shutdown_inference_workers
+
+    TICK_SECONDS = 0.01
+
+    # how late each simulated text update starts, in ms
+    async def text_updates(latencies, stop):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            scheduled = loop.time() + TICK_SECONDS
+            await asyncio.sleep(TICK_SECONDS)
+            latencies.append(1000 * (loop.time() - scheduled))
+
+    async def on_event_loop(audio):
+        return transcribe_batch([audio])
+
+    async def in_executor(audio):
+        return await run_stt_job(transcribe_batch, [audio])
+
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    async def main():
+        clips = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                clips.append(await decode_audio(f.read()))
+
+        warm_up_whisper()  # for the event loop run
+        await warm_up_stt_workers(warm_up_whisper)
+
+        for name, transcribe in [("event loop", on_event_loop), (f"{STT_EXECUTOR} executor", in_executor)]:
+            latencies, stop = [], asyncio.Event()
+            ticker = asyncio.create_task(text_updates(latencies, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*(transcribe(clip) for clip in clips))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await ticker
+            print(f"{name}: {len(clips)} clips in {elapsed:.1f}s, text update latency "
+                  f"p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms")
+
+        shutdown_stt_executor()
+        shutdown_inference_workers()
+
+    asyncio.run(main())
@@ -1,38 +1,160 @@
-import os
-import uuid
-import whisper
+import asyncio
+import threading
+import numpy as np
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import model
+from config import WHISPER_MODEL, STT_BACKEND, STT_COMPUTE_TYPE, STT_BEAM_SIZE, STT_WORKERS, STT_QUEUE_SIZE, STT_BATCH_SIZE, STT_BATCH_WINDOW_MS
+from config import STT_EXECUTOR, TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL, TRANSCRIPT_CACHE_PERSIST, INFERENCE_MODE
+from services.stt_executor import run_in_stt_executor
+from services.inference_workers import InferenceWorkers
+from services.micro_batcher import MicroBatcher
+from services.ttl_cache import TTLCache
+from services.model_registry import models
+from services.stt_backends import create_stt_backend, SAMPLE_RATE
+from database.database_functions import get_transcript, save_transcript
 
 
-async def speech_to_text(voice):
+stt_backend = create_stt_backend(STT_BACKEND, WHISPER_MODEL, STT_COMPUTE_TYPE, STT_BEAM_SIZE)
+
+
+# the model of a process is shared by its threads: a backend that isn't thread safe decodes one batch at a time
+decode_lock = threading.Lock()
+
+
+# runs inside the STT worker pool, returns one text per clip
+def transcribe_batch(audios):
+    model = models.get("whisper")  # loaded in this worker on first use
+    if stt_backend.thread_safe:
+        results = stt_backend.transcribe_batch(model, audios)
+    else:
+        with decode_lock:
+            results = stt_backend.transcribe_batch(model, audios)
+    return [text for text, _ in results]
+
+
+# runs inside the STT worker pool: loads the model there and decodes one second of silence
+def warm_up_whisper(audios=()):
+    transcribe_batch([np.zeros(SAMPLE_RATE, dtype=np.float32)])
+
+
+# with INFERENCE_MODE=workers or STT_EXECUTOR=process, STT runs in dedicated processes (started on first use)
+STT_IN_PROCESSES = INFERENCE_MODE == "workers" or STT_EXECUTOR == "process"
+
+# every worker process warms Whisper up when it starts, so no job waits for a model load
+# a replaced (crashed) pool is warmed up again before Whisper counts as ready
+stt_workers = InferenceWorkers("stt", STT_WORKERS, initializer=warm_up_whisper,
+                               on_restart=lambda: models.restart_warm_up("whisper"))
+
+
+# func(audios) off the event loop, in the STT thread pool or a worker process
+async def run_stt_job(func, audios=()):
+    if STT_IN_PROCESSES:
+        return await stt_workers.run(func, audios)
+    return await run_in_stt_executor(func, audios)
+
+
+# Whisper is ready once every worker has it: worker processes warm up in their initializer, so starting
+# them is enough, the thread workers share one model that func warms up once
+async def warm_up_stt_workers(func, audios=()):
+    if STT_IN_PROCESSES:
+        return await stt_workers.start()
+    return await run_in_stt_executor(func, audios)
+
+
+models.register("whisper", stt_backend.load, warmup=warm_up_whisper, run_in=warm_up_stt_workers)
+
+
+async def process_stt_batch(audios):
+    results = await run_stt_job(transcribe_batch, audios)
+    print(f"[STT] Decoded batch of {len(audios)} (metrics: {stt_batcher.get_metrics()})")
+    return results
+
+
+# batches decoded at once: one per worker, unless the thread workers share a model that isn't thread safe
+if STT_IN_PROCESSES or stt_backend.thread_safe:
+    STT_PARALLEL_BATCHES = STT_WORKERS
+else:
+    STT_PARALLEL_BATCHES = 1
+
+stt_batcher = MicroBatcher(
+    "stt",
+    process_stt_batch,
+    max_batch_size=STT_BATCH_SIZE,
+    window_ms=STT_BATCH_WINDOW_MS,
+    max_in_flight=STT_PARALLEL_BATCHES,
+    max_queue=STT_QUEUE_SIZE,
+)
+
+
+def get_stt_metrics():
+    return stt_batcher.get_metrics()
+
+
+# decode any audio ffmpeg understands into 16 kHz mono float32 samples, entirely in memory
+async def decode_audio(data):
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    pcm, error = await process.communicate(bytes(data))
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode audio: {error.decode(errors='ignore').strip()}")
+
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+# Transcripts by voice.file_unique_id, so the same voice note (or a forwarded copy) is transcribed once
+transcript_cache = TTLCache(TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL)
+# Transcriptions currently running, so concurrent requests for the same voice share one result
+pending_transcripts = {}
+
+
+def get_transcript_cache_stats():
+    return transcript_cache.get_stats()
+
+
+async def transcribe_voice(voice):
+    # Download the OGG voice message into memory
     file = await voice.get_file()
+    data = await file.download_as_bytearray()
 
-    filename = uuid.uuid4().hex # Creating unique filename for each voice message
-    ogg_path = f"{filename}.ogg"
-    wav_path = f"{filename}.wav"
+    audio = await decode_audio(data)
+
+    # Transcribe audio (batched with other pending voice notes)
+    return await stt_batcher.submit(audio)
+
+
+async def speech_to_text(voice):
+    key = voice.file_unique_id
+    text = transcript_cache.get(key)
+    if text is not None:
+        return text
 
     try:
-        # Download OGG voice message
-        await file.download_to_drive(ogg_path)
+        if key in pending_transcripts:
+            return await asyncio.shield(pending_transcripts[key])
 
-        # Convert .ogg to .wav
-        os.system(f"ffmpeg -i {ogg_path} -ar 16000 -ac 1 -c:a pcm_s16le {wav_path}")
+        text = await get_transcript(key) if TRANSCRIPT_CACHE_PERSIST else None
+        if text is None:
+            pending_transcripts[key] = asyncio.ensure_future(transcribe_voice(voice))
+            try:
+                text = await asyncio.shield(pending_transcripts[key])
+            finally:
+                pending_transcripts.pop(key, None)
 
-        # Transcribe audio
-        result = model.transcribe(wav_path)
-        return result["text"]
+            if TRANSCRIPT_CACHE_PERSIST:
+                await save_transcript(key, text)
+
+        transcript_cache.set(key, text)
+        return text
 
     except Exception as e:
         text = f"Error happened in converting the text: {e}"
         return text
 
-    finally:
-        # Cleanup
-        if os.path.exists(ogg_path): os.remove(ogg_path)
-        if os.path.exists(wav_path): os.remove(wav_path)
-
 
 '''async def speech_to_text_when_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     voice = update.message.voice
@@ -0,0 +1,104 @@
+import subprocess
+from io import BytesIO
+from gtts import gTTS
+from pydub import AudioSegment
+
+
+# A speech engine: turns text in a language ("en", "ar", ...) into audio bytes
+class TTSBackend:
+    name = None
+    audio_format = None  # format of the bytes returned by synthesize (as understood by pydub/ffmpeg)
+
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+    # everything that changes the produced audio, used in TTS cache keys
+    def settings(self):
+        return {"engine": self.name}
+
+
+# Google Translate TTS (needs network access)
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    audio_format = "mp3"
+
+    def __init__(self, slow=False):
+        self.slow = slow
+
+    def synthesize(self, text, lang):
+        audio = BytesIO()
+        tts = gTTS(text=text, lang=lang, slow=self.slow)
+        tts.write_to_fp(audio)
+        return audio.getvalue()
+
+    def settings(self):
+        return {"engine": self.name, "slow": self.slow}
+
+
+# espeak-ng running locally as a subprocess (works offline, supports English and Arabic)
+class EspeakBackend(TTSBackend):
+    name = "espeak"
+    audio_format = "ogg"
+
+    def __init__(self, executable="espeak-ng", speed=150):
+        self.executable = executable
+        self.speed = speed
+
+    def synthesize(self, text, lang):
+        result = subprocess.run(
+            [self.executable, "-v", lang, "-s", str(self.speed), "--stdout"],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=True,
+        )
+
+        # Telegram voice notes must be OGG/OPUS, espeak-ng writes WAV
+        audio = BytesIO()
+        AudioSegment.from_file(BytesIO(result.stdout), format="wav").export(audio, format="ogg", codec="libopus")
+        return audio.getvalue()
+
+    def settings(self):
+        return {"engine": self.name, "speed": self.speed}
+
+
+def create_tts_backend(name, espeak_path="espeak-ng"):
+    if name == "gtts":
+        return GTTSBackend()
+    if name == "espeak":
+        return EspeakBackend(executable=espeak_path)
+    raise ValueError(f"Unknown TTS backend: {name}")
+
+
+# Benchmark: python -m services.tts_backends [espeak-ng path]
+# synthesis latency per character of each engine on short and long English and Arabic texts
+if __name__ == "__main__":
+    import sys
+    import time
+
+    texts = [
+        ("en", "You have two new messages."),
+        ("en", "Switched to Family. Ahmad said: I will be home late tonight, "
+               "do not wait for me for dinner. Sara said: see you tomorrow at the station. " * 3),
+        ("ar", "لديك رسالتان جديدتان."),
+        ("ar", "تم الانتقال إلى العائلة. قال أحمد: سأعود إلى البيت متأخرًا الليلة، "
+               "لا تنتظروني على العشاء. قالت سارة: أراكم غدًا في المحطة. " * 3),
+    ]
+    backends = [GTTSBackend(), EspeakBackend(executable=sys.argv[1] if len(sys.argv) > 1 else "espeak-ng")]
+
+    for backend in backends:
+        try:
+            backend.synthesize("warm up", "en")
+        except Exception as e:
+            print(f"{backend.name}: unavailable ({e})")
+            continue
+
+        total_chars = total_seconds = 0
+        for lang, text in texts:
+            start = time.perf_counter()
+            audio = backend.synthesize(text, lang)
+            elapsed = time.perf_counter() - start
+            total_chars += len(text)
+            total_seconds += elapsed
+            print(f"{backend.name} [{lang}] {len(text)} chars: {1000 * elapsed:.0f} ms, "
+                  f"{1000 * elapsed / len(text):.2f} ms/char, {len(audio)} bytes")
+        print(f"{backend.name}: {1000 * total_seconds / total_chars:.2f} ms/char overall")
@@ -0,0 +1,129 @@
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Synthesized audio keyed by a hash of (normalized text, language, voice settings).
+# Recent entries live in memory up to memory_budget bytes; entries evicted from memory
+# spill to files in directory, which is trimmed (oldest first) to disk_budget bytes.
+# File reads, writes and scans run in asyncio's default threads (never on the event loop), so cache
+# I/O doesn't wait behind syntheses in the TTS pool.
+class TTSCache:
+    def __init__(self, memory_budget, directory, disk_budget):
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.disk_budget = disk_budget
+
+        self._memory = OrderedDict()  # key -> audio bytes
+        self._memory_size = 0
+        self._disk_size = None  # computed on first spill
+        self._disk_lock = threading.Lock()  # spills can run in several threads at once
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, language, settings):
+        normalized = " ".join(text.split())
+        raw = f"{normalized}\x00{language}\x00{sorted(settings.items())}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    async def get(self, key):
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return audio
+
+        audio = await asyncio.to_thread(self._read_file, key)
+        if audio is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        await self._store_in_memory(key, audio)
+        return audio
+
+    async def set(self, key, audio):
+        if key in self._memory:
+            return
+        await self._store_in_memory(key, audio)
+
+    async def _store_in_memory(self, key, audio):
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+
+        evicted = []
+        while self._memory_size > self.memory_budget and len(self._memory) > 1:
+            evicted_key, evicted_audio = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted_audio)
+            evicted.append((evicted_key, evicted_audio))
+
+        if evicted:
+            await asyncio.to_thread(self._spill_to_disk, evicted)
+
+    # blocking
+    def _read_file(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            return None
+        return audio
+
+    # blocking
+    def _spill_to_disk(self, entries):
+        with self._disk_lock:
+            for key, audio in entries:
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = self._path(key)
+                    if os.path.exists(path):
+                        continue
+                    with open(path, "wb") as f:
+                        f.write(audio)
+                except OSError as e:
+                    print(f"[ERROR] Failed to write TTS cache file: {e}")
+                    continue
+
+                if self._disk_size is None:
+                    self._disk_size = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+                else:
+                    self._disk_size += len(audio)
+
+            if self._disk_size is not None and self._disk_size > self.disk_budget:
+                self._evict_disk()
+
+    # delete the least recently used files until the store is back under 90% of its budget (blocking, under _disk_lock)
+    def _evict_disk(self):
+        entries = sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime)
+        target = self.disk_budget * 0.9
+        for entry in entries:
+            if self._disk_size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._disk_size -= size
+            except OSError:
+                continue
+
+    def get_stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size or 0,
+        }
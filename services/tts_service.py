@@ -1,79 +1,137 @@
-from gtts import gTTS
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram import Update
-from langdetect import detect
 from io import BytesIO
 from pydub import AudioSegment #library to concatenate audio files
 import io
 import string
-import os
-import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DIR, TTS_CACHE_DISK_BYTES, TTS_CONCURRENCY
+from config import TTS_BACKEND, ESPEAK_PATH
+from services.tts_cache import TTSCache
+from services.tts_backends import create_tts_backend
+from services.language_detection import detect_language
 
-async def text_to_speech_when_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Speech engine selected in config ("gtts" or the offline "espeak")
+tts_backend = create_tts_backend(TTS_BACKEND, espeak_path=ESPEAK_PATH)
+
+# the TTS backend, pydub and the cache's disk store are blocking, so they run here instead of on the event loop
+# (the pool size limits how many syntheses run at once)
+tts_executor = ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix="tts")
+
+
+async def run_in_tts_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tts_executor, func, *args)
+
+
+tts_cache = TTSCache(TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DIR, TTS_CACHE_DISK_BYTES)
+
+
+def get_tts_cache_stats():
+    return tts_cache.get_stats()
 
-    # Create an in-memory file using BytesIO
-    audio = BytesIO()
-    try:
-        user_text = update.message.text
-        lang = detect(user_text)
-        if lang not in ['en', 'ar']:
-            lang = 'ar'  # Arabic as Default
-
-        # Convert text to speech and write to the in-memory file
-        tts = gTTS(text=user_text, lang=lang)
-        tts.write_to_fp(audio)
-
-    except Exception:
-        lang = locals().get('lang', 'ar') #in case language detection failed
-        if lang == 'ar':
-            tts = gTTS(text="حدث خطأ. حاولوا مرة أخرى", lang="ar")
-        else:
-            tts = gTTS(text="Sorry, something went wrong. Please try again.", lang="en")
-        tts.write_to_fp(audio)
-
-    audio.seek(0) # to start at the beginning of the BytesIO stream
-    await update.message.reply_voice(voice=audio)
-        
 
+def synthesize(text, lang):
+    return tts_backend.synthesize(text, lang)
 
-async def text_to_speech(user_text):
-    audio = BytesIO()  # Create buffer first
 
+# runs in the TTS executor, returns (audio, succeeded)
+def synthesize_with_fallback(user_text, lang):
     try:
-        lang = detect(user_text)
-        tts = gTTS(text=user_text, lang=lang)
-        tts.write_to_fp(audio)
+        return synthesize(user_text, lang), True
 
     except Exception as e:
-        lang = locals().get('lang', 'ar')
+        print(f"[ERROR] Speech synthesis failed: {e}")
         fallback_text = "Sorry, something went wrong. Please try again." if lang == "en" else "حدث خطأ. حاولوا مرة أخرى"
-        tts = gTTS(text=fallback_text, lang=lang)
-        tts.write_to_fp(audio)
+        return synthesize(fallback_text, lang), False
+
+
+# runs in the TTS executor
+def merge_audio(voice_en, voice_ar, pause_ms):
+    # Load voices into pydub
+    sound_en = AudioSegment.from_file(voice_en, format=tts_backend.audio_format)
+    sound_ar = AudioSegment.from_file(voice_ar, format=tts_backend.audio_format)
+
+    # Add pause and merge
+    pause = AudioSegment.silent(duration=pause_ms)
+    combined = sound_en + pause + sound_ar
+
+    # Export merged audio as .ogg with OPUS codec
+    merged = BytesIO()
+    combined.export(merged, format="ogg", codec="libopus")
+    return merged.getvalue()
+
 
-    audio.seek(0)
+async def text_to_speech_when_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # languages other than english and arabic are read in Arabic (default)
+    audio = await text_to_speech(update.message.text, default_lang="ar")
+    await update.message.reply_voice(voice=audio)
+        
+
+
+# language is an optional hint ("arabic"/"english" from users.language, or "ar"/"en"),
+# when it is given the text is not analysed at all
+async def text_to_speech(user_text, language=None, default_lang=None):
+    audio, _ = await text_to_speech_with_status(user_text, language, default_lang)
     return audio
 
+
+# returns (audio, succeeded): succeeded is False when the audio is the spoken error message
+async def text_to_speech_with_status(user_text, language=None, default_lang=None):
+    lang = detect_language(user_text, hint=language)
+    if default_lang and lang not in ['en', 'ar']:
+        lang = default_lang
+
+    key = tts_cache.make_key(user_text, lang, tts_backend.settings())
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        return BytesIO(cached), True
+
+    audio, succeeded = await run_in_tts_executor(synthesize_with_fallback, user_text, lang)
+    if succeeded:
+        await tts_cache.set(key, audio)
+
+    return BytesIO(audio), succeeded
+
 #async def ask_to_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
  #   audio = await text_to_speech("Do you want to reply? (Say 'yes' or 'no')")
   #  await update.message.reply_voice(audio)
 
 async def merge_texts_to_speech(text_en: str, text_ar: str, pause_ms=1000):
-    # Convert texts to voice
-    voice_en = await text_to_speech(text_en)
-    voice_ar = await text_to_speech(text_ar)
+    audio, _ = await merge_texts_to_speech_with_status(text_en, text_ar, pause_ms)
+    return audio
 
-    # Load voices into pydub
-    sound_en = AudioSegment.from_file(voice_en, format="mp3")
-    sound_ar = AudioSegment.from_file(voice_ar, format="mp3")
 
-    # Add pause and merge
-    pause = AudioSegment.silent(duration=pause_ms)
-    combined = sound_en + pause + sound_ar
+# returns (audio, succeeded): succeeded is False when either half is the spoken error message
+async def merge_texts_to_speech_with_status(text_en: str, text_ar: str, pause_ms=1000):
+    key = tts_cache.make_key(f"{text_en}\x00{text_ar}", f"merged:{pause_ms}", tts_backend.settings())
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        return BytesIO(cached), True
 
-    # Export merged audio as .ogg with OPUS codec
-    os.makedirs("temp_audio", exist_ok=True)
-    output_path = f"temp_audio/{uuid.uuid4().hex}.ogg"
-    combined.export(output_path, format="ogg", codec="libopus")
+    # Convert both texts to voice in parallel
+    (voice_en, en_succeeded), (voice_ar, ar_succeeded) = await asyncio.gather(
+        text_to_speech_with_status(text_en, language="en"),
+        text_to_speech_with_status(text_ar, language="ar"),
+    )
+
+    merged = await run_in_tts_executor(merge_audio, voice_en, voice_ar, pause_ms)
+    succeeded = en_succeeded and ar_succeeded
+    if succeeded:  # never keep the spoken error message
+        await tts_cache.set(key, merged)
+
+    return BytesIO(merged), succeeded
 
-    return output_path
+
+# Synthesize all chunks concurrently and send them as successive voice notes, in order.
+# The first chunk is sent as soon as it is ready, while the rest are still being synthesized.
+async def reply_speech_chunks(message, chunks):
+    tasks = [asyncio.create_task(text_to_speech(chunk)) for chunk in chunks]
+    try:
+        for task in tasks:
+            await message.reply_voice(await task)
+    finally:
+        for task in tasks:
+            task.cancel()
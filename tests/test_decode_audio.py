@@ -0,0 +1,37 @@
+# Voice notes are decoded in memory (no temp files) into what Whisper expects: 16 kHz mono float32 in [-1, 1].
+# Uses the sample voice notes in temp_audio/.
+import os
+import glob
+import shutil
+import asyncio
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("telegram")
+pytest.importorskip("psycopg_pool")
+if shutil.which("ffmpeg") is None:
+    pytest.skip("ffmpeg is not installed", allow_module_level=True)
+
+from services.stt_service import decode_audio
+from services.stt_backends import SAMPLE_RATE
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp_audio", "*.ogg")))
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_decode_voice_note(path):
+    with open(path, "rb") as f:
+        data = bytearray(f.read())  # what file.download_as_bytearray() returns
+
+    audio = asyncio.run(decode_audio(data))
+
+    assert SAMPLE_RATE == 16000
+    assert audio.dtype == np.float32
+    assert audio.ndim == 1
+    assert len(audio) > SAMPLE_RATE // 10  # voice notes last more than a tenth of a second
+    assert np.abs(audio).max() <= 1.0
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(RuntimeError):
+        asyncio.run(decode_audio(b"not an ogg file"))
@@ -0,0 +1,108 @@
+# The hot queries must be able to use the indexes of migration 2 (see database/migrations.py).
+# Runs against a real Postgres (DATABASE_URL), inside a transaction that is rolled back: the migrations
+# are applied if needed and seq scans are disabled, so small test tables don't hide a missing index.
+import os
+import asyncio
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("psycopg_pool")
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+import psycopg
+from database import database_functions
+from database.migrations import run_migrations
+from database.partitions import ensure_partitions
+
+
+# stands in for the connection pool: records the queries a function runs instead of running them
+class RecordingPool:
+    def __init__(self):
+        self.queries = []
+
+    def connection(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.queries.append((query, params))
+        return self
+
+    async def fetchone(self):
+        return None
+
+    async def fetchall(self):
+        return []
+
+
+def recorded_queries(monkeypatch, func, *args, **kwargs):
+    recorder = RecordingPool()
+    monkeypatch.setattr(database_functions, "pool", recorder)
+    asyncio.run(func(*args, **kwargs))
+    return recorder.queries
+
+
+# names of the indexes the plan scans
+async def planned_indexes(conn, query, params):
+    cur = await conn.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = (await cur.fetchone())[0]
+
+    names = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            names.add(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return names
+
+
+# the index and, for a partitioned table, the matching index of each partition
+async def index_family(conn, name):
+    cur = await conn.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+    ''', (name,))
+    return {name} | {row[0] for row in await cur.fetchall()}
+
+
+def assert_uses_index(queries, index_name):
+    async def check():
+        async with await psycopg.AsyncConnection.connect(os.environ["DATABASE_URL"]) as conn:
+            try:
+                await run_migrations(conn)
+                await ensure_partitions(conn)
+                await conn.execute("SET LOCAL enable_seqscan = off")
+
+                family = await index_family(conn, index_name)
+                for query, params in queries:
+                    used = await planned_indexes(conn, query, params)
+                    assert used & family, f"{index_name} not used, plan scans {sorted(used)}:\n{query}"
+            finally:
+                await conn.rollback()
+
+    asyncio.run(check())
+
+
+def test_unseen_messages_use_partial_index(monkeypatch):
+    queries = recorded_queries(monkeypatch, database_functions.get_unSeen_messages, 1, -100)
+    assert_uses_index(queries, "idx_message_deliveries_unseen")
+
+
+def test_user_by_username_uses_index(monkeypatch):
+    queries = recorded_queries(monkeypatch, database_functions.get_user_id_by_username, "@someone")
+    assert_uses_index(queries, "idx_users_username")
+
+
+def test_message_fan_out_uses_group_members_index(monkeypatch):
+    queries = recorded_queries(monkeypatch, database_functions.ingest_group_message, -100, "group", 1, "sender", "hello")
+    assert_uses_index(queries, "idx_user_groups_group")
@@ -0,0 +1,56 @@
+# Syntheses run in the TTS executor, so two requests are synthesized at the same time instead of one after the other.
+# The speech engine is replaced by a stub that sleeps, no network or espeak-ng needed.
+import time
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("pydub")
+pytest.importorskip("gtts")
+pytest.importorskip("langdetect")
+
+from services import tts_service
+from services.tts_cache import TTSCache
+
+SYNTHESIS_SECONDS = 0.3
+
+
+class SleepingBackend:
+    name = "sleeping"
+    audio_format = "ogg"
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def synthesize(self, text, lang):
+        start = time.perf_counter()
+        time.sleep(SYNTHESIS_SECONDS)  # blocking, like gTTS or espeak-ng
+        with self.lock:
+            self.spans.append((start, time.perf_counter()))
+        return f"{lang}:{text}".encode("utf-8")
+
+    def settings(self):
+        return {"engine": self.name}
+
+
+def test_concurrent_syntheses_overlap(monkeypatch, tmp_path):
+    backend = SleepingBackend()
+    monkeypatch.setattr(tts_service, "tts_backend", backend)
+    monkeypatch.setattr(tts_service, "tts_cache", TTSCache(1024 * 1024, str(tmp_path), 1024 * 1024))
+
+    async def main():
+        start = time.perf_counter()
+        first, second = await asyncio.gather(
+            tts_service.text_to_speech("first message", language="en"),
+            tts_service.text_to_speech("second message", language="en"),
+        )
+        return time.perf_counter() - start, first.getvalue(), second.getvalue()
+
+    elapsed, first, second = asyncio.run(main())
+
+    assert (first, second) == (b"en:first message", b"en:second message")
+    (start_a, end_a), (start_b, end_b) = backend.spans
+    assert start_a < end_b and start_b < end_a  # both were running at the same time
+    assert elapsed < 2 * SYNTHESIS_SECONDS